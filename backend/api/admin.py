@@ -12,12 +12,9 @@ class IngredientAdmin(admin.ModelAdmin):
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ("name", "author", "count_favorites")
+    list_display = ("name", "author", "favorites_count", "in_carts_count")
     list_filter = ("author", "name", "tags")
 
-    def count_favorites(self, obj):
-        return obj.favorites.count()
-
 
 class FootgramUserAdmin(admin.ModelAdmin):
     search_fields = ("username", "email")
@@ -30,3 +27,4 @@ admin.site.register(models.Cart)
 admin.site.register(models.Favorite)
 admin.site.register(models.FootgramUser, FootgramUserAdmin)
 admin.site.register(models.Follow)
+admin.site.register(models.CartIngredientTotal)
@@ -0,0 +1,114 @@
+import copy
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from rest_framework.authentication import TokenAuthentication
+
+from api import const
+from api.reference_cache import shared_version
+
+
+class TokenCache:
+    """LRU token -> (пользователь, токен) в памяти процесса с TTL.
+
+    Как и у справочников из reference_cache, версия кэша хранится в общем
+    кэше (settings.CACHES). Выход, смена пароля, деактивация и другие
+    изменения пользователя меняют версию, и каждый воркер не позже чем
+    через TOKEN_CACHE_VERSION_CHECK_INTERVAL секунд сбрасывает свою копию.
+
+    При settings.TOKEN_AUTH_SHARED_CACHE промахи ищутся еще и в общем кэше,
+    под ключом с версией, поэтому смена версии сбрасывает и его.
+    """
+
+    version_key = "auth:token:version"
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._version = None
+        self._checked_at = 0
+
+    def _check_version(self):
+        now = time.monotonic()
+        if now - self._checked_at < const.TOKEN_CACHE_VERSION_CHECK_INTERVAL:
+            return
+        version = shared_version(self.version_key)
+        self._checked_at = now
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def _shared_key(self, key):
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return f"auth:token:{self._version}:{digest}"
+
+    def _put(self, key, value):
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            self._check_version()
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                return entry[0]
+            self._entries.pop(key, None)
+            if not settings.TOKEN_AUTH_SHARED_CACHE:
+                return None
+            shared_key = self._shared_key(key)
+        value = cache.get(shared_key)
+        if value is not None:
+            with self._lock:
+                self._put(key, value)
+        return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._check_version()
+            self._put(key, value)
+            shared_key = self._shared_key(key)
+        if settings.TOKEN_AUTH_SHARED_CACHE:
+            cache.set(shared_key, value, self.ttl)
+
+    def invalidate(self):
+        """Сбрасывает кэш только в текущем процессе."""
+        with self._lock:
+            self._entries.clear()
+
+    def bump_version(self):
+        cache.set(self.version_key, uuid.uuid4().hex, None)
+        self.invalidate()
+        with self._lock:
+            self._checked_at = 0
+
+
+token_cache = TokenCache(const.TOKEN_CACHE_SIZE, const.TOKEN_CACHE_TTL)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса Token + пользователь для токенов,
+    уже встречавшихся в этом процессе (или в общем кэше).
+
+    Каждый запрос получает свои копии пользователя и токена, чтобы
+    изменения request.user не перетекали в кэш.
+    """
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is None:
+            cached = super().authenticate_credentials(key)
+            token_cache.set(key, cached)
+        user, token = (copy.copy(obj) for obj in cached)
+        token.user = user
+        return user, token
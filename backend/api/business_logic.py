@@ -1,23 +1,649 @@
-from api.models import AmountIngredientInRecipe
+import csv
+import io
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, Max, Sum, When, Window
+from django.db.models.functions import Greatest, RowNumber
+from django.utils import timezone
+
+from PIL import Image, ImageDraw, ImageFont
+
+from api import const
+from api.models import (
+    AmountIngredientInRecipe,
+    Cart,
+    CartIngredientTotal,
+    Favorite,
+    Follow,
+    FootgramUser,
+    Recipe,
+    RecipeScore,
+    ScoreRefresh,
+    TimelineEntry
+)
+from api.viewer_state import changed_on_commit
 
 
 def get_list_for_shop(user):
-    shopping_list = ["Список покупок"]
-    results = {}
-    ingredients = AmountIngredientInRecipe.objects.filter(
-        recipe__in_cart__user=user
-    ).values_list(
-        "ingredients__name", "ingredients__measurement_unit", "amount"
-    )
-    for item in ingredients:
-        name = item[0]
-        if name not in results:
-            results[name] = {"measurement": item[1], "amount": item[2]}
-        else:
-            results[name]["amount"] += item[2]
-    for result in results:
-        shopping_list.append(
-            f'{result}: {results[result]["amount"]}'
-            f'{results[result]["measurement"]}'
-        )
-    return "\n".join(shopping_list)
+    """Список покупок из материализованной таблицы CartIngredientTotal."""
+    return (
+        CartIngredientTotal.objects.filter(user=user)
+        .order_by("ingredient__name", "ingredient__measurement_unit")
+        .values_list(
+            "ingredient__name",
+            "ingredient__measurement_unit",
+            "total_amount",
+        )
+    )
+
+
+def compute_cart_totals(user_ids=None):
+    """Суммы ингредиентов корзин, посчитанные заново по всем рецептам."""
+    queryset = AmountIngredientInRecipe.objects.filter(
+        recipe__in_cart__isnull=False
+    )
+    if user_ids is not None:
+        queryset = queryset.filter(recipe__in_cart__user__in=user_ids)
+    return (
+        queryset.values("recipe__in_cart__user", "ingredients")
+        .annotate(total_amount=Sum("amount"))
+        .order_by("recipe__in_cart__user", "ingredients")
+        .values_list("recipe__in_cart__user", "ingredients", "total_amount")
+    )
+
+
+def _add_cart_totals(user_ids, amounts):
+    """Прибавляет amounts к суммам одним INSERT ... ON CONFLICT DO UPDATE.
+
+    Одновременные добавления одного ингредиента не упираются в
+    UniqueConstraint: вторая вставка превращается в UPDATE строки первой.
+    """
+    quote = connection.ops.quote_name
+    meta = CartIngredientTotal._meta
+    table = quote(meta.db_table)
+    user = quote(meta.get_field("user").column)
+    ingredient = quote(meta.get_field("ingredient").column)
+    total = quote(meta.get_field("total_amount").column)
+    # Строки в одном порядке во всех транзакциях, чтобы не ловить deadlock.
+    rows = [
+        (user_id, ingredient_id, amounts[ingredient_id])
+        for user_id in sorted(user_ids)
+        for ingredient_id in sorted(amounts)
+    ]
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), const.CART_TOTALS_BATCH_SIZE):
+            batch = rows[start:start + const.CART_TOTALS_BATCH_SIZE]
+            values = ", ".join(["(%s, %s, %s)"] * len(batch))
+            cursor.execute(
+                f"INSERT INTO {table} ({user}, {ingredient}, {total}) "
+                f"VALUES {values} "
+                f"ON CONFLICT ({user}, {ingredient}) DO UPDATE "
+                f"SET {total} = {table}.{total} + EXCLUDED.{total}",
+                [value for row in batch for value in row],
+            )
+
+
+def _subtract_cart_totals(user_ids, amounts):
+    """Вычитает amounts из сумм и удаляет обнулившиеся строки."""
+    queryset = CartIngredientTotal.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=amounts
+    )
+    queryset.update(
+        total_amount=Greatest(
+            Case(
+                *[
+                    When(
+                        ingredient_id=ingredient_id,
+                        then=F("total_amount") - amount,
+                    )
+                    for ingredient_id, amount in amounts.items()
+                ],
+                default=F("total_amount"),
+            ),
+            0,
+        )
+    )
+    queryset.filter(total_amount=0).delete()
+
+
+def apply_cart_deltas(user_ids, deltas):
+    """Меняет суммы в списках покупок пользователей на deltas.
+
+    deltas — словарь {id ингредиента: изменение количества}. Вызывается
+    внутри транзакции вместе с изменением корзины или рецепта. Суммы
+    меняются атомарно в базе, без чтения строк заранее.
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    added = {key: value for key, value in deltas.items() if value > 0}
+    removed = {key: -value for key, value in deltas.items() if value < 0}
+    if added:
+        _add_cart_totals(user_ids, added)
+    if removed:
+        _subtract_cart_totals(user_ids, removed)
+
+
+def change_cart_totals(user_id, recipe_ids, sign):
+    """Добавляет (sign=1) или убирает (sign=-1) рецепты из списка покупок."""
+    amounts = (
+        AmountIngredientInRecipe.objects.filter(recipe_id__in=recipe_ids)
+        .order_by()
+        .values("ingredients_id")
+        .annotate(total_amount=Sum("amount"))
+        .values_list("ingredients_id", "total_amount")
+    )
+    deltas = {
+        ingredient_id: sign * total_amount
+        for ingredient_id, total_amount in amounts
+    }
+    if deltas:
+        apply_cart_deltas([user_id], deltas)
+
+
+def change_recipe_in_carts(recipe, old_amounts, new_amounts):
+    """Переносит изменение ингредиентов рецепта в корзины с этим рецептом."""
+    deltas = {
+        ingredient_id: new_amounts.get(ingredient_id, 0)
+        - old_amounts.get(ingredient_id, 0)
+        for ingredient_id in old_amounts.keys() | new_amounts.keys()
+    }
+    if not any(deltas.values()):
+        return
+    user_ids = recipe.in_cart.values_list("user_id", flat=True)
+    apply_cart_deltas(user_ids, deltas)
+
+
+# (модель, поле счетчика, что считаем, внешний ключ на модель)
+COUNTERS = (
+    (Recipe, "favorites_count", Favorite, "recipe"),
+    (Recipe, "in_carts_count", Cart, "recipe"),
+    (FootgramUser, "recipes_count", Recipe, "author"),
+    (FootgramUser, "followers_count", Follow, "author"),
+)
+
+
+def change_counters(sender, instances, delta):
+    """Сдвигает на delta счетчики, которые зависят от записей sender.
+
+    Вызывается в той же транзакции, что и вставка или удаление записей.
+    """
+    for model, field, child, fk in COUNTERS:
+        if child is not sender:
+            continue
+        ids = defaultdict(int)
+        for instance in instances:
+            pk = getattr(instance, f"{fk}_id")
+            if pk is not None:
+                ids[pk] += delta
+        pks_by_change = defaultdict(list)
+        for pk, change in ids.items():
+            if change:
+                pks_by_change[change].append(pk)
+        for change, pks in pks_by_change.items():
+            model.objects.filter(pk__in=pks).update(
+                **{field: F(field) + change}
+            )
+
+
+def compute_counters(child, fk, ids):
+    """Значения счетчика для ids, посчитанные по самим записям."""
+    counts = dict(
+        child.objects.filter(**{f"{fk}__in": ids})
+        .order_by()
+        .values(fk)
+        .annotate(count=Count("pk"))
+        .values_list(fk, "count")
+    )
+    return {pk: counts.get(pk, 0) for pk in ids}
+
+
+def fan_out_recipe(recipe):
+    """Раскладывает новый рецепт по лентам подписчиков автора.
+
+    Рецепты авторов с очень большим числом подписчиков в ленты не
+    пишутся: get_feed_sources подмешивает их при чтении.
+    """
+    author = recipe.author
+    if (
+        author is None
+        or author.followers_count > const.FEED_FANOUT_MAX_FOLLOWERS
+    ):
+        return
+    follower_ids = Follow.objects.filter(author=author).values_list(
+        "user_id", flat=True
+    )
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=user_id, recipe=recipe, pub_date=recipe.pub_date
+            )
+            for user_id in follower_ids.iterator()
+        ),
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+def backfill_timeline(user_id, author_ids):
+    """Добавляет в ленту последние рецепты авторов, на которых подписались.
+
+    Один INSERT ... SELECT: не больше FEED_BACKFILL_RECIPES рецептов на
+    автора (ROW_NUMBER() OVER (PARTITION BY author_id)), авторы с большим
+    числом подписчиков пропускаются, как в fan_out_recipe. Возвращает
+    число добавленных записей.
+    """
+    quote = connection.ops.quote_name
+    meta = TimelineEntry._meta
+    ranked = (
+        Recipe.objects.filter(
+            author_id__in=author_ids,
+            author__followers_count__lte=const.FEED_FANOUT_MAX_FOLLOWERS,
+        )
+        .annotate(
+            row_number=Window(
+                expression=RowNumber(),
+                partition_by=[F("author_id")],
+                order_by=[F("pub_date").desc(), F("id").desc()],
+            )
+        )
+        .values("id", "pub_date", "row_number")
+    )
+    sql, params = ranked.query.sql_with_params()
+    columns = ", ".join(
+        quote(meta.get_field(name).column)
+        for name in ("user", "recipe", "pub_date")
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {quote(meta.db_table)} ({columns}) "
+            f"SELECT %s, ranked.id, ranked.pub_date FROM ({sql}) ranked "
+            "WHERE ranked.row_number <= %s ON CONFLICT DO NOTHING",
+            (user_id, *params, const.FEED_BACKFILL_RECIPES),
+        )
+        return cursor.rowcount
+
+
+def remove_from_timeline(user, author):
+    TimelineEntry.objects.filter(user=user, recipe__author=author).delete()
+
+
+def get_feed_sources(user):
+    """Выборки id рецептов ленты с ключами сортировки (pub_date, id).
+
+    Основная выборка идет по таблице TimelineEntry, рецепты авторов, не
+    попадающих в fan_out_recipe, читаются напрямую из Recipe.
+    """
+    sources = [
+        (
+            TimelineEntry.objects.filter(user=user).values_list("recipe_id"),
+            ("pub_date", "recipe_id"),
+        )
+    ]
+    popular_authors = list(
+        Follow.objects.filter(
+            user=user,
+            author__followers_count__gt=const.FEED_FANOUT_MAX_FOLLOWERS,
+        ).values_list("author_id", flat=True)
+    )
+    if popular_authors:
+        sources.append(
+            (
+                Recipe.objects.filter(
+                    author_id__in=popular_authors
+                ).values_list("id"),
+                ("pub_date", "id"),
+            )
+        )
+    return sources
+
+
+def popular_score(favorites_count, in_carts_count):
+    return (
+        favorites_count * const.FAVORITE_SCORE_WEIGHT
+        + in_carts_count * const.CART_SCORE_WEIGHT
+    )
+
+
+def refresh_popular_scores(batch_size=1000):
+    """Пересчитывает popular_score по счетчикам рецептов.
+
+    Читает Recipe пачками (таблицы избранного и корзин не трогает), пишет
+    только изменившиеся рейтинги и создает недостающие строки. Возвращает
+    число записанных рейтингов.
+    """
+    written = 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            recipes = list(
+                Recipe.objects.filter(id__gt=last_id)
+                .order_by("id")
+                .values_list("id", "favorites_count", "in_carts_count")[
+                    :batch_size
+                ]
+            )
+            if not recipes:
+                return written
+            last_id = recipes[-1][0]
+            current = dict(
+                RecipeScore.objects.filter(
+                    recipe_id__in=[recipe_id for recipe_id, *_ in recipes]
+                ).values_list("recipe_id", "popular_score")
+            )
+            to_create = []
+            to_update = []
+            for recipe_id, favorites_count, in_carts_count in recipes:
+                score = RecipeScore(
+                    recipe_id=recipe_id,
+                    popular_score=popular_score(
+                        favorites_count, in_carts_count
+                    ),
+                )
+                if recipe_id not in current:
+                    to_create.append(score)
+                elif current[recipe_id] != score.popular_score:
+                    to_update.append(score)
+            RecipeScore.objects.bulk_create(to_create, ignore_conflicts=True)
+            RecipeScore.objects.bulk_update(to_update, ["popular_score"])
+            written += len(to_create) + len(to_update)
+
+
+def _new_activity(model, last_id, max_id):
+    return (
+        model.objects.filter(id__gt=last_id, id__lte=max_id)
+        .order_by()
+        .values("recipe_id")
+        .annotate(count=Count("id"))
+        .values_list("recipe_id", "count")
+    )
+
+
+@transaction.atomic
+def refresh_trending_scores(batch_size=1000):
+    """Затухание trending_score и начисление за новую активность.
+
+    Новые записи избранного и корзин ищутся по id больше запомненного в
+    ScoreRefresh, поэтому читается только хвост этих таблиц. Первый запуск
+    только запоминает текущие id. Возвращает число рецептов с новой
+    активностью.
+    """
+    now = timezone.now()
+    max_favorite_id = Favorite.objects.aggregate(Max("id"))["id__max"] or 0
+    max_cart_id = Cart.objects.aggregate(Max("id"))["id__max"] or 0
+    state = ScoreRefresh.objects.select_for_update().order_by("id").first()
+    if state is None:
+        ScoreRefresh.objects.create(
+            last_favorite_id=max_favorite_id,
+            last_cart_id=max_cart_id,
+            refreshed_at=now,
+        )
+        return 0
+    elapsed = (now - state.refreshed_at).total_seconds()
+    decay = 0.5 ** (max(elapsed, 0) / const.TRENDING_HALF_LIFE)
+    scores = RecipeScore.objects.filter(trending_score__gt=0)
+    scores.filter(
+        trending_score__lt=const.TRENDING_MIN_SCORE / decay
+    ).update(trending_score=0)
+    scores.update(trending_score=F("trending_score") * decay)
+    deltas = defaultdict(float)
+    for model, weight, last_id, max_id in (
+        (
+            Favorite,
+            const.FAVORITE_SCORE_WEIGHT,
+            state.last_favorite_id,
+            max_favorite_id,
+        ),
+        (Cart, const.CART_SCORE_WEIGHT, state.last_cart_id, max_cart_id),
+    ):
+        for recipe_id, count in _new_activity(model, last_id, max_id):
+            deltas[recipe_id] += weight * count
+    recipe_ids = sorted(deltas)
+    for start in range(0, len(recipe_ids), batch_size):
+        batch = list(
+            RecipeScore.objects.filter(
+                recipe_id__in=recipe_ids[start:start + batch_size]
+            )
+        )
+        for score in batch:
+            score.trending_score += deltas[score.recipe_id]
+        RecipeScore.objects.bulk_update(batch, ["trending_score"])
+    state.last_favorite_id = max_favorite_id
+    state.last_cart_id = max_cart_id
+    state.refreshed_at = now
+    state.save()
+    return len(deltas)
+
+
+def _relation_columns(model, field_name):
+    quote = connection.ops.quote_name
+    field = model._meta.get_field(field_name)
+    return (
+        quote(model._meta.db_table),
+        quote(model._meta.get_field("user").column),
+        quote(field.column),
+        field.related_model._meta,
+    )
+
+
+def insert_relations(model, user_id, field_name, target_ids):
+    """Связывает пользователя с объектами одним INSERT ... ON CONFLICT.
+
+    Строки вставляются только для существующих объектов, с которыми связи
+    еще нет, поэтому одновременные запросы не упираются в
+    UniqueConstraint. Сигналы post_save не отправляются. Возвращает id
+    объектов, для которых строка действительно добавлена (RETURNING).
+    """
+    target_ids = sorted(set(target_ids))
+    if not target_ids:
+        return set()
+    quote = connection.ops.quote_name
+    table, user_column, column, target = _relation_columns(model, field_name)
+    target_pk = quote(target.pk.column)
+    placeholders = ", ".join(["%s"] * len(target_ids))
+    sql = (
+        f"INSERT INTO {table} ({user_column}, {column}) "
+        f"SELECT %s, {target_pk} FROM {quote(target.db_table)} "
+        f"WHERE {target_pk} IN ({placeholders}) "
+        f"ON CONFLICT DO NOTHING RETURNING {column}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id, *target_ids])
+        return {row[0] for row in cursor.fetchall()}
+
+
+def insert_relation(model, user_id, field_name, target_id):
+    """insert_relations для одного объекта; True, если строка добавлена."""
+    return bool(insert_relations(model, user_id, field_name, [target_id]))
+
+
+def delete_relations(model, user_id, field_name, target_ids):
+    """Удаляет связи одним DELETE без сигналов post_delete.
+
+    Возвращает id объектов, связь с которыми была удалена (RETURNING).
+    """
+    target_ids = sorted(set(target_ids))
+    if not target_ids:
+        return set()
+    table, user_column, column, _ = _relation_columns(model, field_name)
+    placeholders = ", ".join(["%s"] * len(target_ids))
+    sql = (
+        f"DELETE FROM {table} WHERE {user_column} = %s "
+        f"AND {column} IN ({placeholders}) RETURNING {column}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id, *target_ids])
+        return {row[0] for row in cursor.fetchall()}
+
+
+def delete_relation(model, user_id, field_name, target_id):
+    """delete_relations для одного объекта; True, если связь была."""
+    return bool(delete_relations(model, user_id, field_name, [target_id]))
+
+
+def recipes_list_changed(model, user, recipe_ids, sign):
+    """Счетчики, корзина и ViewerState после вставки или удаления без
+    сигналов.
+
+    model — Favorite или Cart, sign — 1 после добавления, -1 после
+    удаления.
+    """
+    if not recipe_ids:
+        return
+    change_counters(
+        model,
+        [model(user=user, recipe_id=recipe_id) for recipe_id in recipe_ids],
+        sign,
+    )
+    if model is Cart:
+        change_cart_totals(user.id, recipe_ids, sign)
+    changed_on_commit([user.id])
+
+
+def _list_statuses(recipe_ids, changed, changed_status, unchanged_status):
+    """Статусы bulk-операции; существование рецепта проверяется только
+    для id, которых запрос не коснулся.
+    """
+    existing = set(changed)
+    unchanged = set(recipe_ids) - existing
+    if unchanged:
+        existing.update(
+            Recipe.objects.filter(id__in=unchanged).values_list(
+                "id", flat=True
+            )
+        )
+    return {
+        recipe_id: (
+            changed_status
+            if recipe_id in changed
+            else unchanged_status if recipe_id in existing else "not_found"
+        )
+        for recipe_id in recipe_ids
+    }
+
+
+@transaction.atomic
+def bulk_add_recipes(model, user, recipe_ids):
+    """Добавляет рецепты в избранное или корзину (model) одним INSERT.
+
+    Счетчики и корзина меняются только для рецептов, которые вернул
+    INSERT ... RETURNING. Возвращает статус для каждого id: added, exists
+    или not_found.
+    """
+    added = insert_relations(model, user.id, "recipe", recipe_ids)
+    recipes_list_changed(model, user, sorted(added), 1)
+    return _list_statuses(recipe_ids, added, "added", "exists")
+
+
+@transaction.atomic
+def bulk_remove_recipes(model, user, recipe_ids):
+    """Убирает рецепты из избранного или корзины (model) одним DELETE.
+
+    Счетчики и корзина меняются только для рецептов, которые вернул
+    DELETE ... RETURNING. Возвращает статус для каждого id: removed,
+    missing или not_found.
+    """
+    removed = delete_relations(model, user.id, "recipe", recipe_ids)
+    recipes_list_changed(model, user, sorted(removed), -1)
+    return _list_statuses(recipe_ids, removed, "removed", "missing")
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def render_txt(rows):
+    yield f"{const.SHOPPING_LIST_TITLE}\n"
+    for name, measurement_unit, amount in rows:
+        yield f"{name}: {amount}{measurement_unit}\n"
+
+
+def render_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(("Ингредиент", "Единицы измерения", "Количество"))
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _pdf_font():
+    try:
+        return ImageFont.truetype(
+            settings.SHOPPING_LIST_FONT, const.PDF_FONT_SIZE
+        )
+    except OSError:
+        return ImageFont.load_default()
+
+
+def render_pdf(rows):
+    font = _pdf_font()
+    lines_per_page = (
+        const.PDF_PAGE_SIZE[1] - 2 * const.PDF_MARGIN
+    ) // const.PDF_LINE_HEIGHT
+    pages = []
+    lines = render_txt(rows)
+    while True:
+        page_lines = [
+            line.rstrip("\n")
+            for _, line in zip(range(lines_per_page), lines)
+        ]
+        if not page_lines:
+            break
+        page = Image.new("RGB", const.PDF_PAGE_SIZE, "white")
+        draw = ImageDraw.Draw(page)
+        for number, line in enumerate(page_lines):
+            draw.text(
+                (
+                    const.PDF_MARGIN,
+                    const.PDF_MARGIN + number * const.PDF_LINE_HEIGHT,
+                ),
+                line,
+                font=font,
+                fill="black",
+            )
+        pages.append(page)
+    buffer = io.BytesIO()
+    pages[0].save(buffer, "PDF", save_all=True, append_images=pages[1:])
+    yield buffer.getvalue()
+
+
+SHOPPING_LIST_FORMATS = {
+    "txt": (render_txt, "text/plain; charset=utf-8"),
+    "csv": (render_csv, "text/csv; charset=utf-8"),
+    "pdf": (render_pdf, "application/pdf"),
+}
+
+
+def attach_limited_recipes(authors, limit=None):
+    """Кладет в author.limited_recipes не больше limit последних рецептов.
+
+    Рецепты всех авторов страницы выбираются одним запросом: при заданном
+    limit номер рецепта внутри автора считается оконной функцией
+    ROW_NUMBER() OVER (PARTITION BY author_id).
+    """
+    recipes_by_author = defaultdict(list)
+    queryset = Recipe.objects.filter(author__in=authors)
+    if limit is None:
+        recipes = queryset
+    else:
+        ranked = queryset.annotate(
+            row_number=Window(
+                expression=RowNumber(),
+                partition_by=[F("author_id")],
+                order_by=[F("pub_date").desc(), F("id").desc()],
+            )
+        )
+        sql, params = ranked.query.sql_with_params()
+        recipes = Recipe.objects.raw(
+            f"SELECT * FROM ({sql}) ranked "
+            "WHERE ranked.row_number <= %s "
+            "ORDER BY ranked.pub_date DESC, ranked.id DESC",
+            (*params, limit),
+        )
+    for recipe in recipes:
+        recipes_by_author[recipe.author_id].append(recipe)
+    for author in authors:
+        author.limited_recipes = recipes_by_author[author.id]
+    return authors
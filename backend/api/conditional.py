@@ -0,0 +1,58 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+
+from api import reference_cache
+from api.viewer_state import get_viewer_state
+
+VERSION_FIELDS = (
+    "id",
+    "updated_at",
+    "favorites_count",
+    "author__email",
+    "author__username",
+    "author__first_name",
+    "author__last_name",
+)
+
+
+def recipe_versions(queryset):
+    """Легкий запрос: то, от чего зависит представление рецептов.
+
+    Возвращает строки, по которым считается ETag, без prefetch и
+    сериализации. Первым значением в строке идет id рецепта. Отметки
+    пользователя (избранное, корзина, подписки) учитываются в ETag
+    версией ViewerState.
+    """
+    return queryset.prefetch_related(None).values_list(*VERSION_FIELDS)
+
+
+def make_etag(request, rows, *extra):
+    state = (
+        request.user.pk,
+        get_viewer_state(request).version,
+        request.get_host(),
+        reference_cache.tag_cache.version(),
+        reference_cache.ingredient_cache.version(),
+        *extra,
+        *rows,
+    )
+    return '"{}"'.format(hashlib.sha1(repr(state).encode()).hexdigest())
+
+
+def not_modified(request, etag):
+    """Ответ 304, если у клиента актуальная версия, иначе None.
+
+    Только по ETag: Last-Modified по updated_at рецепта не учитывал бы
+    автора, тэги, ингредиенты и счетчики, от которых зависит ответ.
+    """
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        set_validators(response, etag)
+    return response
+
+
+def set_validators(response, etag):
+    response["ETag"] = etag
+    patch_vary_headers(response, ("Authorization",))
+    return response
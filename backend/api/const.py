@@ -8,4 +8,41 @@ MAX_LEN_RECIPES_CHARFIELD = 200
 MIN_TIME_FOR_RECIPE = 1
 MIN_AMOUNT = 1
 IMAGE_SIZE = 400, 400
-FILE_NAME = "{username}_list_for_shop.txt"
+RECIPE_IMAGE_DIR = "picture_for_recipe"
+IMAGE_VARIANTS = {
+    "card": IMAGE_SIZE,
+    "detail": (1200, 1200),
+    "original": None,
+}
+IMAGE_QUALITY = 85
+UPLOAD_DIR = "uploads"
+UPLOAD_IMAGE_FORMATS = ("JPEG", "PNG", "WEBP", "GIF")
+UPLOAD_TOKEN_TTL = 24 * 60 * 60
+IMAGE_PROCESSING_WORKERS = 2
+FILE_NAME = "{username}_list_for_shop.{extension}"
+SHOPPING_LIST_TITLE = "Список покупок"
+DEFAULT_SHOPPING_LIST_FORMAT = "txt"
+PDF_PAGE_SIZE = 827, 1169
+PDF_MARGIN = 60
+PDF_FONT_SIZE = 18
+PDF_LINE_HEIGHT = 28
+INGREDIENT_SEARCH_LIMIT = 50
+REFERENCE_VERSION_CHECK_INTERVAL = 1
+FEED_FANOUT_MAX_FOLLOWERS = 10000
+FEED_BACKFILL_RECIPES = 200
+RECIPE_SEARCH_MAX_TERMS = 8
+FAVORITE_SCORE_WEIGHT = 1.0
+CART_SCORE_WEIGHT = 2.0
+TRENDING_HALF_LIFE = 3 * 24 * 60 * 60
+TRENDING_MIN_SCORE = 0.01
+# Поля сортировки для ?ordering=..., по всем полям по убыванию.
+RECIPE_ORDERINGS = {
+    "popular": ("score__popular_score", "score__recipe_id"),
+    "trending": ("score__trending_score", "score__recipe_id"),
+}
+MAX_BULK_RECIPES = 100
+CART_TOTALS_BATCH_SIZE = 500
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_TTL = 5 * 60
+TOKEN_CACHE_VERSION_CHECK_INTERVAL = 1
+VIEWER_STATE_TTL = 10 * 60
@@ -0,0 +1,46 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Алиас реплики, из которой читает текущий запрос. Ставится
+# ReplicaRoutingMiddleware только для безопасных запросов без недавних
+# записей; вне запросов (команды, фоновые задачи) чтение идет из default.
+read_alias = ContextVar("read_alias", default=None)
+
+# Приложения, чьи чтения всегда идут в default: токен или сессия, только
+# что созданные при входе, могут еще не доехать до реплики.
+PRIMARY_ONLY_APPS = ("authtoken", "sessions")
+
+
+@contextmanager
+def reading_from(alias):
+    token = read_alias.set(alias)
+    try:
+        yield
+    finally:
+        read_alias.reset(token)
+
+
+class ReplicaRouter:
+    """Чтение из реплики, выбранной для запроса, запись в default.
+
+    Внутри транзакции на default чтение остается в default, чтобы видеть
+    собственные незафиксированные изменения.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = read_alias.get()
+        if (
+            alias is None
+            or model._meta.app_label in PRIMARY_ONLY_APPS
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
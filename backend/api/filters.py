@@ -1,19 +1,82 @@
 from django.contrib.auth import get_user_model
+from django.db.models import Exists, OuterRef
 
 from django_filters.rest_framework import FilterSet, filters
 
+from api import const
 from api.models import Recipe
+from api.reference_cache import tag_cache
+from api.search import search_recipes
 
 User = get_user_model()
 
 
+def _ids_by_slug(tags):
+    return {tag.slug: tag.id for tag in tags}
+
+
+def get_tag_ids_by_slug(slugs=()):
+    """Соответствие slug -> id тэга из reference_cache.
+
+    Если среди slugs есть неизвестный снимку, версия сверяется сразу: тэг
+    мог появиться в другом процессе до очередной сверки. Если версия та
+    же, такого тэга нет, и таблица не перечитывается.
+    """
+    tag_ids = tag_cache.derived("ids_by_slug", _ids_by_slug)
+    if not tag_ids.keys() >= set(slugs):
+        tag_ids = tag_cache.derived(
+            "ids_by_slug", _ids_by_slug, check_version=True
+        )
+    return tag_ids
+
+
+def tag_choices():
+    return [(slug, slug) for slug in get_tag_ids_by_slug()]
+
+
 class AuthorAndTagFilter(FilterSet):
-    tags = filters.AllValuesMultipleFilter(field_name="tags__slug")
-    author = filters.ModelChoiceFilter(queryset=User.objects.all())
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_choices, method="filter_tags"
+    )
+    author = filters.ModelChoiceFilter(queryset=User.objects.only("id"))
     is_favorited = filters.BooleanFilter(method="filter_is_favorited")
     is_in_shopping_cart = filters.BooleanFilter(
         method="filter_is_in_shopping_cart"
     )
+    search = filters.CharFilter(method="filter_search")
+    ordering = filters.ChoiceFilter(
+        choices=[(name, name) for name in const.RECIPE_ORDERINGS],
+        method="filter_ordering",
+    )
+
+    def __init__(self, data=None, *args, **kwargs):
+        super().__init__(data, *args, **kwargs)
+        if self.is_bound and hasattr(self.data, "getlist"):
+            get_tag_ids_by_slug(self.data.getlist("tags"))
+
+    def filter_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        tag_ids = get_tag_ids_by_slug(value)
+        return queryset.filter(
+            Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe_id=OuterRef("pk"),
+                    tag_id__in=[
+                        tag_ids[slug] for slug in value if slug in tag_ids
+                    ],
+                )
+            )
+        )
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def filter_ordering(self, queryset, name, value):
+        """Сортировка по рейтингу из RecipeScore через его индекс."""
+        return queryset.filter(score__isnull=False).order_by(
+            *(f"-{field}" for field in const.RECIPE_ORDERINGS[value])
+        )
 
     def filter_is_favorited(self, queryset, name, value):
         if value and not self.request.user.is_anonymous:
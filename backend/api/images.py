@@ -0,0 +1,125 @@
+import hashlib
+import io
+import posixpath
+import re
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from PIL import Image, ImageOps
+
+from api import const
+
+FORMAT_EXTENSIONS = {"JPEG": "jpg", "WEBP": "webp"}
+PROCESSED_NAME = re.compile(
+    rf"^{const.RECIPE_IMAGE_DIR}/[0-9a-f]{{2}}/[0-9a-f]{{64}}/original\.jpg$"
+)
+
+
+def _variant_name(directory, variant, image_format):
+    return f"{directory}/{variant}.{FORMAT_EXTENSIONS[image_format]}"
+
+
+def _encode(image, image_format):
+    buffer = io.BytesIO()
+    image.save(
+        buffer, image_format, quality=const.IMAGE_QUALITY, optimize=True
+    )
+    return ContentFile(buffer.getvalue())
+
+
+def _to_rgb(image):
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def _save(name, content):
+    """Сохраняет файл точно под именем name.
+
+    Storage.save не перезаписывает файлы и при занятом имени пишет под
+    другим. Раз оригинала еще нет, имя занято либо остатком прерванной
+    обработки, либо той же картинкой из параллельного запроса (каталог
+    назван по содержимому), поэтому занявший его файл заменяется, а
+    сохраненный под другим именем удаляется.
+    """
+    saved_name = default_storage.save(name, content)
+    if saved_name == name:
+        return
+    default_storage.delete(saved_name)
+    default_storage.delete(name)
+    content.seek(0)
+    saved_name = default_storage.save(name, content)
+    if saved_name != name:
+        # Имя снова занял параллельный запрос: у него та же картинка.
+        default_storage.delete(saved_name)
+
+
+def process_recipe_image(file):
+    """Сохраняет варианты изображения и возвращает имя оригинала.
+
+    Файл читается по частям и декодируется один раз, метаданные (EXIF и
+    пр.) отбрасываются при перекодировании. Каталог называется по sha256
+    загруженных байтов, поэтому одинаковые загрузки не пишутся повторно.
+    """
+    sha256 = hashlib.sha256()
+    for chunk in file.chunks():
+        sha256.update(chunk)
+    digest = sha256.hexdigest()
+    directory = f"{const.RECIPE_IMAGE_DIR}/{digest[:2]}/{digest}"
+    original_name = _variant_name(directory, "original", "JPEG")
+    if default_storage.exists(original_name):
+        return original_name
+    file.seek(0)
+    with Image.open(file) as uploaded:
+        image = _to_rgb(uploaded)
+    for variant, size in const.IMAGE_VARIANTS.items():
+        resized = image
+        if size is not None:
+            resized = image.copy()
+            resized.thumbnail(size, Image.LANCZOS)
+        for image_format in FORMAT_EXTENSIONS:
+            name = _variant_name(directory, variant, image_format)
+            if name == original_name:
+                continue
+            _save(name, _encode(resized, image_format))
+    _save(original_name, _encode(image, "JPEG"))
+    return original_name
+
+
+def variant_urls(image, request=None):
+    """URL всех вариантов изображения рецепта.
+
+    Для изображений, загруженных до появления вариантов, все варианты
+    ссылаются на исходный файл.
+    """
+    if not image:
+        return None
+
+    def build_url(name):
+        url = default_storage.url(name)
+        return request.build_absolute_uri(url) if request else url
+
+    if not PROCESSED_NAME.match(image.name):
+        url = build_url(image.name)
+        return {
+            variant: {
+                image_format.lower(): url
+                for image_format in FORMAT_EXTENSIONS
+            }
+            for variant in const.IMAGE_VARIANTS
+        }
+    directory = posixpath.dirname(image.name)
+    return {
+        variant: {
+            image_format.lower(): build_url(
+                _variant_name(directory, variant, image_format)
+            )
+            for image_format in FORMAT_EXTENSIONS
+        }
+        for variant in const.IMAGE_VARIANTS
+    }
@@ -0,0 +1,132 @@
+import csv
+import json
+import time
+from abc import ABC, abstractmethod
+from itertools import islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file, fields):
+    for row in csv.reader(file):
+        row = [value.strip() for value in row]
+        if row and row != list(fields):
+            yield dict(zip(fields, row))
+
+
+def read_json_lines(file, fields):
+    for line in file:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def read_json_array(file, fields):
+    """Разбирает JSON-массив объектов по частям, не читая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    started = False
+    eof = False
+    while True:
+        buffer = buffer.lstrip()
+        if not started:
+            if not buffer.startswith("["):
+                if buffer or eof:
+                    raise CommandError("Ожидался JSON-массив")
+            else:
+                buffer = buffer[1:].lstrip()
+                started = True
+        if started:
+            if buffer.startswith(","):
+                buffer = buffer[1:].lstrip()
+            if buffer.startswith("]"):
+                return
+            if buffer:
+                try:
+                    item, end = decoder.raw_decode(buffer)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise CommandError("Некорректный JSON")
+                else:
+                    yield item
+                    buffer = buffer[end:]
+                    continue
+        if eof:
+            raise CommandError("Неожиданный конец JSON")
+        chunk = file.read(READ_CHUNK_SIZE)
+        eof = not chunk
+        buffer += chunk
+
+
+READERS = {
+    "csv": read_csv,
+    "json": read_json_array,
+    "jsonl": read_json_lines,
+}
+
+
+class CatalogLoadCommand(BaseCommand, ABC):
+    """Потоковая загрузка справочника пачками по batch_size строк."""
+
+    fields = ()
+    reference_cache = None
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Путь к файлу CSV, JSON или JSONL.")
+        parser.add_argument(
+            "--format",
+            choices=READERS,
+            help="Формат файла, по умолчанию определяется по расширению.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Сколько строк загружать в одной транзакции.",
+        )
+
+    @abstractmethod
+    def load_batch(self, rows, options):
+        """Сохраняет пачку строк и возвращает число созданных записей."""
+
+    def clean_row(self, row):
+        try:
+            return tuple(str(row[field]).strip() for field in self.fields)
+        except KeyError as error:
+            raise CommandError(f"В строке {row} нет поля {error}")
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        file_format = options["format"] or path.suffix.lstrip(".").lower()
+        if file_format not in READERS:
+            raise CommandError(f"Неизвестный формат файла: {path.name}")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size должен быть больше нуля")
+        started = time.monotonic()
+        total = created = 0
+        with path.open(encoding="utf-8-sig", newline="") as file:
+            rows = (
+                self.clean_row(row)
+                for row in READERS[file_format](file, self.fields)
+            )
+            while True:
+                batch = list(islice(rows, options["batch_size"]))
+                if not batch:
+                    break
+                with transaction.atomic():
+                    created += self.load_batch(batch, options)
+                total += len(batch)
+        if self.reference_cache is not None:
+            self.reference_cache.bump_version()
+        elapsed = time.monotonic() - started
+        rate = total / elapsed if elapsed else total
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Обработано строк: {total}, создано: {created}, "
+                f"{elapsed:.2f} с, {rate:.0f} строк/с"
+            )
+        )
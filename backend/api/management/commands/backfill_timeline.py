@@ -0,0 +1,49 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.business_logic import backfill_timeline
+from api.models import Follow
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет ленты подписок (TimelineEntry) последними рецептами "
+        "авторов, на которых подписаны пользователи."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            type=int,
+            nargs="+",
+            help="id пользователей, чьи ленты заполнить. По умолчанию все.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Сколько пользователей обрабатывать в одной транзакции.",
+        )
+
+    def handle(self, *args, **options):
+        follows = Follow.objects.order_by("user_id")
+        if options["user"]:
+            follows = follows.filter(user_id__in=options["user"])
+        authors = defaultdict(list)
+        for user_id, author_id in follows.values_list("user_id", "author_id"):
+            authors[user_id].append(author_id)
+        user_ids = list(authors)
+        batch_size = options["batch_size"]
+        entries = 0
+        for start in range(0, len(user_ids), batch_size):
+            with transaction.atomic():
+                for user_id in user_ids[start:start + batch_size]:
+                    entries += backfill_timeline(user_id, authors[user_id])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Пользователей: {len(user_ids)}, "
+                f"рецептов в лентах: {entries}"
+            )
+        )
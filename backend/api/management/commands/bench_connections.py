@@ -0,0 +1,106 @@
+import statistics
+import time
+from wsgiref.util import setup_testing_defaults
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет стоимость открытия соединения с базой на запрос: гоняет "
+        "запросы через WSGI-обработчик, как gunicorn, с CONN_MAX_AGE=0 и "
+        "с постоянным соединением. База берется из настроек, поэтому для "
+        "замера Postgres или PgBouncer достаточно задать DATABASE_URL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            default="/api/recipes/?limit=1",
+            help="Адрес, который запрашивать.",
+        )
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument(
+            "--max-age",
+            type=int,
+            default=60,
+            help="CONN_MAX_AGE для замера с постоянным соединением.",
+        )
+
+    def handle(self, *args, **options):
+        connection = connections[DEFAULT_DB_ALIAS]
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            raise CommandError(
+                "База SQLite в памяти пропадает при закрытии соединения, "
+                "для замера нужна база в файле."
+            )
+        handler = WSGIHandler()
+        path, _, query = options["path"].partition("?")
+        saved_max_age = connection.settings_dict["CONN_MAX_AGE"]
+        self.stdout.write(
+            f"{connection.vendor}, {options['requests']} запросов {path}"
+        )
+        try:
+            results = [
+                self._measure(handler, path, query, max_age, options)
+                for max_age in (0, options["max_age"])
+            ]
+        finally:
+            connection.settings_dict["CONN_MAX_AGE"] = saved_max_age
+            connection.close()
+        for max_age, opened, timings, statuses in results:
+            self.stdout.write(
+                f"CONN_MAX_AGE={max_age}: открыто соединений {opened}, "
+                f"медиана {statistics.median(timings):.3f} мс, "
+                f"p95 {self._p95(timings):.3f} мс, ответы {statuses}"
+            )
+        (_, _, churn, _), (_, _, persistent, _) = results
+        cost = statistics.median(churn) - statistics.median(persistent)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Цена соединения на запрос (разница медиан): {cost:.3f} мс"
+            )
+        )
+
+    def _measure(self, handler, path, query, max_age, options):
+        connection = connections[DEFAULT_DB_ALIAS]
+        connection.close()
+        connection.settings_dict["CONN_MAX_AGE"] = max_age
+        opened = []
+
+        def count_connection(sender, connection, **kwargs):
+            opened.append(connection.alias)
+
+        connection_created.connect(count_connection)
+        try:
+            self._request(handler, path, query)
+            opened.clear()
+            timings = []
+            statuses = set()
+            for _ in range(options["requests"]):
+                started = time.perf_counter()
+                statuses.add(self._request(handler, path, query))
+                timings.append((time.perf_counter() - started) * 1000)
+        finally:
+            connection_created.disconnect(count_connection)
+        return max_age, len(opened), timings, sorted(statuses)
+
+    def _request(self, handler, path, query):
+        environ = {"PATH_INFO": path, "QUERY_STRING": query}
+        setup_testing_defaults(environ)
+        statuses = []
+
+        def start_response(status, headers, exc_info=None):
+            statuses.append(status.split()[0])
+
+        response = handler(environ, start_response)
+        for _ in response:
+            pass
+        response.close()
+        return statuses[0]
+
+    def _p95(self, timings):
+        return statistics.quantiles(timings, n=20)[-1]
@@ -0,0 +1,211 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api.models import (
+    AmountIngredientInRecipe,
+    Cart,
+    Favorite,
+    Follow,
+    FootgramUser,
+    Ingredient,
+    Recipe,
+    Tag
+)
+
+HOT_PATH_INDEXES = (
+    "recipe_pub_date_idx",
+    "recipe_author_pub_date_idx",
+    "cart_recipe_user_idx",
+    "favorite_recipe_user_idx",
+    "follow_author_user_idx",
+    "recipe_tags_tag_recipe_idx",
+    "amount_recipe_ingredient_idx",
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет базу синтетическими данными и сравнивает планы и время "
+        "горячих запросов без индексов из миграции 0006 и с ними. Все "
+        "изменения выполняются в транзакции и откатываются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--recipes", type=int, default=20000)
+        parser.add_argument("--ingredients-per-recipe", type=int, default=8)
+        parser.add_argument("--favorites-per-user", type=int, default=50)
+        parser.add_argument("--follows-per-user", type=int, default=20)
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=20,
+            help="Сколько раз выполнять каждый запрос для замера.",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            started = time.monotonic()
+            sample = self._seed(options)
+            self.stdout.write(
+                f"Данные созданы за {time.monotonic() - started:.1f} с "
+                f"({connection.vendor})"
+            )
+            queries = self._queries(sample)
+            after = self._measure(queries, options["repeat"])
+            with connection.cursor() as cursor:
+                for name in HOT_PATH_INDEXES:
+                    cursor.execute(f"DROP INDEX {name}")
+            before = self._measure(queries, options["repeat"])
+            for title in queries:
+                self.stdout.write(self.style.MIGRATE_HEADING(title))
+                for label, results in (("до", before), ("после", after)):
+                    plan, timing = results[title]
+                    self.stdout.write(f"  {label}: {timing:.3f} мс")
+                    for line in plan.splitlines():
+                        self.stdout.write(f"    {line}")
+            transaction.set_rollback(True)
+
+    def _seed(self, options):
+        rng = random.Random(0)
+        FootgramUser.objects.bulk_create(
+            FootgramUser(
+                username=f"bench{i}",
+                email=f"bench{i}@example.com",
+                password="!",
+            )
+            for i in range(options["users"])
+        )
+        users = list(
+            FootgramUser.objects.filter(username__startswith="bench")
+        )
+        tags = [
+            Tag.objects.create(
+                name=f"bench {i}", color=f"#BE{i:04X}", slug=f"bench-{i}"
+            )
+            for i in range(12)
+        ]
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f"bench {i}", measurement_unit="г")
+            for i in range(2000)
+        )
+        ingredient_ids = list(
+            Ingredient.objects.filter(name__startswith="bench").values_list(
+                "id", flat=True
+            )
+        )
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author=rng.choice(users),
+                    name=f"bench {i}",
+                    text="bench",
+                    cooking_time=10,
+                    image="bench.jpg",
+                )
+                for i in range(options["recipes"])
+            ),
+            batch_size=1000,
+        )
+        recipes = list(Recipe.objects.filter(name__startswith="bench"))
+        now = timezone.now()
+        for recipe in recipes:
+            recipe.pub_date = now - timedelta(minutes=rng.randrange(10**6))
+        Recipe.objects.bulk_update(recipes, ["pub_date"], batch_size=1000)
+        through = Recipe.tags.through
+        through.objects.bulk_create(
+            (
+                through(recipe_id=recipe.id, tag_id=tag.id)
+                for recipe in recipes
+                for tag in rng.sample(tags, 2)
+            ),
+            batch_size=1000,
+        )
+        AmountIngredientInRecipe.objects.bulk_create(
+            (
+                AmountIngredientInRecipe(
+                    recipe_id=recipe.id, ingredients_id=ingredient_id, amount=1
+                )
+                for recipe in recipes
+                for ingredient_id in rng.sample(
+                    ingredient_ids, options["ingredients_per_recipe"]
+                )
+            ),
+            batch_size=1000,
+        )
+        for model, per_user in (
+            (Favorite, options["favorites_per_user"]),
+            (Cart, options["favorites_per_user"] // 5),
+        ):
+            model.objects.bulk_create(
+                (
+                    model(user_id=user.id, recipe_id=recipe.id)
+                    for user in users
+                    for recipe in rng.sample(recipes, per_user)
+                ),
+                batch_size=1000,
+            )
+        Follow.objects.bulk_create(
+            (
+                Follow(user_id=user.id, author_id=author.id)
+                for user in users
+                for author in rng.sample(users, options["follows_per_user"])
+                if author != user
+            ),
+            batch_size=1000,
+        )
+        return {
+            "user": users[0],
+            "author": rng.choice(users),
+            "recipe": rng.choice(recipes),
+            "tag": tags[0],
+            "page": [recipe.id for recipe in recipes[:6]],
+        }
+
+    def _queries(self, sample):
+        return {
+            "Лента рецептов по -pub_date": Recipe.objects.order_by(
+                "-pub_date", "-id"
+            )[:6],
+            "Рецепты автора по -pub_date": Recipe.objects.filter(
+                author=sample["author"]
+            ).order_by("-pub_date", "-id")[:6],
+            "Рецепты с тэгом": Recipe.objects.filter(
+                tags__slug=sample["tag"].slug
+            ).order_by("-pub_date", "-id")[:6],
+            "Кто добавил рецепт в избранное": Favorite.objects.filter(
+                recipe=sample["recipe"]
+            ).values_list("user_id"),
+            "В чьих корзинах рецепт": Cart.objects.filter(
+                recipe=sample["recipe"]
+            ).values_list("user_id"),
+            "Подписчики автора": Follow.objects.filter(
+                author=sample["author"]
+            ).values_list("user_id"),
+            "Ингредиенты страницы рецептов": (
+                AmountIngredientInRecipe.objects.filter(
+                    recipe_id__in=sample["page"]
+                )
+                .order_by("recipe_id")
+                .values_list("recipe_id", "ingredients_id", "amount")
+            ),
+        }
+
+    def _measure(self, queries, repeat):
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        results = {}
+        for title, queryset in queries.items():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - started) * 1000)
+            results[title] = (queryset.explain(), statistics.median(timings))
+        return results
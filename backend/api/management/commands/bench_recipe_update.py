@@ -0,0 +1,119 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from api.models import (
+    AmountIngredientInRecipe,
+    FootgramUser,
+    Ingredient,
+    Recipe,
+    Tag
+)
+from api.serializers import RecipeSerializer
+
+WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE")
+
+
+def recreate_update(recipe, tags, ingredients_data):
+    """Прежняя стратегия: удалить все связи рецепта и создать заново."""
+    recipe.save()
+    recipe.tags.clear()
+    recipe.tags.set(tags)
+    AmountIngredientInRecipe.objects.filter(recipe=recipe).delete()
+    AmountIngredientInRecipe.objects.bulk_create(
+        AmountIngredientInRecipe(
+            recipe=recipe, ingredients=ingredient, amount=amount
+        )
+        for ingredient, amount in ingredients_data
+    )
+
+
+def diff_update(recipe, tags, ingredients_data):
+    RecipeSerializer().update(
+        recipe, {"tags": tags, "ingredients": ingredients_data}
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает число операций записи при типичных правках рецепта: "
+        "обновление по разнице против удаления и пересоздания связей. "
+        "Все данные создаются во временной транзакции и откатываются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ingredients",
+            type=int,
+            default=20,
+            help="Сколько ингредиентов в тестовом рецепте.",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self._run(options["ingredients"])
+            transaction.set_rollback(True)
+
+    def _run(self, size):
+        author = FootgramUser.objects.create(
+            username="bench_recipe_update",
+            email="bench_recipe_update@example.com",
+        )
+        tags = [
+            Tag.objects.create(
+                name=f"bench {i}", color=f"#BE00{i:02d}", slug=f"bench-{i}"
+            )
+            for i in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(name=f"bench {i}", measurement_unit="г")
+            for i in range(size + 1)
+        ]
+        base_tags = tags[:2]
+        base_ingredients = [(ingredient, 10) for ingredient in ingredients]
+        base_ingredients.pop()
+        recipe = Recipe.objects.create(
+            author=author, name="bench", text="bench", cooking_time=1
+        )
+        scenarios = (
+            ("без изменений", base_tags, base_ingredients),
+            (
+                "одно количество",
+                base_tags,
+                [(base_ingredients[0][0], 11), *base_ingredients[1:]],
+            ),
+            (
+                "новый ингредиент",
+                base_tags,
+                [*base_ingredients, (ingredients[size], 5)],
+            ),
+            ("замена тэга", [tags[0], tags[2]], base_ingredients),
+        )
+        self.stdout.write(
+            f"{'правка':<20}{'стратегия':<14}{'запросов записи':>16}"
+            f"{'строк пересоздано':>20}"
+        )
+        for title, new_tags, new_ingredients in scenarios:
+            for name, strategy in (
+                ("пересоздание", recreate_update),
+                ("разница", diff_update),
+            ):
+                recreate_update(recipe, base_tags, base_ingredients)
+                recipe = Recipe.objects.get(pk=recipe.pk)
+                writes, churn = self._measure(
+                    strategy, recipe, new_tags, new_ingredients
+                )
+                self.stdout.write(
+                    f"{title:<20}{name:<14}{writes:>16}{churn:>20}"
+                )
+
+    def _measure(self, strategy, recipe, tags, ingredients_data):
+        before = set(recipe.ingredient.values_list("pk", flat=True))
+        with CaptureQueriesContext(connection) as queries:
+            strategy(recipe, tags, ingredients_data)
+        after = set(recipe.ingredient.values_list("pk", flat=True))
+        writes = sum(
+            query["sql"].lstrip().upper().startswith(WRITE_STATEMENTS)
+            for query in queries.captured_queries
+        )
+        return writes, len(before ^ after)
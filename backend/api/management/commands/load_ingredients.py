@@ -0,0 +1,66 @@
+import csv
+import io
+
+from django.db import connection
+
+from api.management.commands._catalog_loader import CatalogLoadCommand
+from api.models import Ingredient
+from api.reference_cache import ingredient_cache
+
+
+class Command(CatalogLoadCommand):
+    help = (
+        "Загружает ингредиенты из CSV/JSON. Уже существующие пары "
+        "(name, measurement_unit) пропускаются, поэтому повторная загрузка "
+        "того же файла ничего не меняет."
+    )
+    fields = ("name", "measurement_unit")
+    reference_cache = ingredient_cache
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--no-copy",
+            action="store_true",
+            help="Не использовать COPY на PostgreSQL.",
+        )
+
+    def load_batch(self, rows, options):
+        rows = list(dict.fromkeys(rows))
+        if connection.vendor == "postgresql" and not options["no_copy"]:
+            return self._copy_batch(rows)
+        # Дубли отсекает UniqueConstraint (name, measurement_unit); число
+        # созданных считается по индексу только для имен из пачки.
+        loaded = Ingredient.objects.filter(name__in={name for name, _ in rows})
+        before = loaded.count()
+        Ingredient.objects.bulk_create(
+            [
+                Ingredient(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in rows
+            ],
+            ignore_conflicts=True,
+        )
+        return loaded.count() - before
+
+    def _copy_batch(self, rows):
+        table = Ingredient._meta.db_table
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TEMPORARY TABLE IF NOT EXISTS ingredient_import "
+                "(name text, measurement_unit text) ON COMMIT DELETE ROWS"
+            )
+            cursor.cursor.copy_expert(
+                "COPY ingredient_import (name, measurement_unit) "
+                "FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
+            cursor.execute(
+                f"INSERT INTO {table} (name, measurement_unit) "
+                "SELECT DISTINCT i.name, i.measurement_unit "
+                "FROM ingredient_import i "
+                "ON CONFLICT (name, measurement_unit) DO NOTHING"
+            )
+            return cursor.rowcount
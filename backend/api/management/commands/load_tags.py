@@ -0,0 +1,62 @@
+from django.core.management.base import CommandError
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from api.management.commands._catalog_loader import CatalogLoadCommand
+from api.models import Tag
+from api.reference_cache import tag_cache
+
+
+class Command(CatalogLoadCommand):
+    help = (
+        "Загружает тэги из CSV/JSON. Тэги ищутся по slug: новые создаются, "
+        "у существующих обновляются название и цвет."
+    )
+    fields = ("name", "color", "slug")
+    reference_cache = tag_cache
+
+    def load_batch(self, rows, options):
+        rows = {slug: (name, color) for name, color, slug in rows}
+        try:
+            with transaction.atomic():
+                return self._upsert(rows)
+        except IntegrityError:
+            raise CommandError(self._conflict(rows))
+
+    def _conflict(self, rows):
+        """Описание строки, чье название или цвет уже занят другим slug."""
+        names = {name for name, _ in rows.values()}
+        colors = {color for _, color in rows.values()}
+        taken = {}
+        for slug, name, color in Tag.objects.filter(
+            Q(name__in=names) | Q(color__in=colors)
+        ).values_list("slug", "name", "color"):
+            taken[("название", name)] = slug
+            taken[("цвет", color)] = slug
+        for slug, (name, color) in rows.items():
+            for key in (("название", name), ("цвет", color)):
+                other = taken.get(key)
+                if other is not None and other != slug:
+                    return (
+                        f"Тэг {slug} ({name}, {color}): {key[0]} "
+                        f"{key[1]} уже занят тэгом {other}"
+                    )
+                taken[key] = slug
+        return "Название или цвет тэга уже заняты"
+
+    def _upsert(self, rows):
+        existing = Tag.objects.in_bulk(rows, field_name="slug")
+        to_update = []
+        for slug, tag in existing.items():
+            name, color = rows[slug]
+            if (tag.name, tag.color) != (name, color):
+                tag.name, tag.color = name, color
+                to_update.append(tag)
+        Tag.objects.bulk_update(to_update, ["name", "color"])
+        new_tags = [
+            Tag(name=name, color=color, slug=slug)
+            for slug, (name, color) in rows.items()
+            if slug not in existing
+        ]
+        Tag.objects.bulk_create(new_tags)
+        return len(new_tags)
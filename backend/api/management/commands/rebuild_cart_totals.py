@@ -0,0 +1,83 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.business_logic import compute_cart_totals
+from api.models import Cart, CartIngredientTotal
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает таблицу CartIngredientTotal по корзинам "
+        "пользователей и сообщает о расхождениях."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Только проверить расхождения, ничего не меняя.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Сколько пользователей пересчитывать в одной транзакции.",
+        )
+
+    def handle(self, *args, **options):
+        user_ids = sorted(
+            set(Cart.objects.values_list("user_id", flat=True)).union(
+                CartIngredientTotal.objects.values_list("user_id", flat=True)
+            )
+        )
+        batch_size = options["batch_size"]
+        drifted = 0
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            with transaction.atomic():
+                drifted += self._process_batch(batch, options["check"])
+        message = (
+            f"Пользователей: {len(user_ids)}, "
+            f"с расхождениями: {drifted}"
+        )
+        if drifted and options["check"]:
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
+
+    def _process_batch(self, user_ids, check_only):
+        expected = {
+            (user_id, ingredient_id): total_amount
+            for user_id, ingredient_id, total_amount in compute_cart_totals(
+                user_ids
+            )
+        }
+        actual = {
+            (user_id, ingredient_id): total_amount
+            for user_id, ingredient_id, total_amount in (
+                CartIngredientTotal.objects.select_for_update()
+                .filter(user_id__in=user_ids)
+                .values_list("user_id", "ingredient_id", "total_amount")
+            )
+        }
+        drifted_users = {
+            user_id
+            for user_id, ingredient_id in expected.keys() | actual.keys()
+            if expected.get((user_id, ingredient_id))
+            != actual.get((user_id, ingredient_id))
+        }
+        for user_id in sorted(drifted_users):
+            self.stdout.write(f"Расхождение у пользователя {user_id}")
+        if check_only or not drifted_users:
+            return len(drifted_users)
+        CartIngredientTotal.objects.filter(user_id__in=drifted_users).delete()
+        CartIngredientTotal.objects.bulk_create(
+            CartIngredientTotal(
+                user_id=user_id,
+                ingredient_id=ingredient_id,
+                total_amount=total_amount,
+            )
+            for (user_id, ingredient_id), total_amount in expected.items()
+            if user_id in drifted_users
+        )
+        return len(drifted_users)
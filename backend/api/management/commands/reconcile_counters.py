@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.business_logic import COUNTERS, compute_counters
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает денормализованные счетчики (избранное, корзины, "
+        "рецепты и подписчики) и сообщает о расхождениях."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Только проверить расхождения, ничего не меняя.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Сколько строк пересчитывать в одной транзакции.",
+        )
+
+    def handle(self, *args, **options):
+        total_drifted = 0
+        for model, field, child, fk in COUNTERS:
+            rows = 0
+            drifted = 0
+            last_pk = None
+            while True:
+                with transaction.atomic():
+                    queryset = model.objects.select_for_update().order_by(
+                        "pk"
+                    )
+                    if last_pk is not None:
+                        queryset = queryset.filter(pk__gt=last_pk)
+                    actual = dict(
+                        queryset.values_list("pk", field)[
+                            :options["batch_size"]
+                        ]
+                    )
+                    if not actual:
+                        break
+                    last_pk = max(actual)
+                    rows += len(actual)
+                    drifted += self._process_batch(
+                        model, field, child, fk, actual, options["check"]
+                    )
+            total_drifted += drifted
+            self.stdout.write(
+                f"{model.__name__}.{field}: строк {rows}, "
+                f"с расхождениями {drifted}"
+            )
+        message = f"Всего расхождений: {total_drifted}"
+        if total_drifted and options["check"]:
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
+
+    def _process_batch(self, model, field, child, fk, actual, check_only):
+        expected = compute_counters(child, fk, list(actual))
+        drifted = [
+            model(pk=pk, **{field: count})
+            for pk, count in expected.items()
+            if actual[pk] != count
+        ]
+        for obj in drifted:
+            self.stdout.write(
+                f"Расхождение {model.__name__}.{field} у {obj.pk}: "
+                f"{actual[obj.pk]} вместо {getattr(obj, field)}"
+            )
+        if drifted and not check_only:
+            model.objects.bulk_update(drifted, [field])
+        return len(drifted)
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from api.business_logic import refresh_popular_scores, refresh_trending_scores
+
+
+class Command(BaseCommand):
+    help = (
+        "Обновляет рейтинги рецептов для ?ordering=popular и "
+        "?ordering=trending. Рассчитана на запуск из cron: учитывает "
+        "только избранное и корзины, добавленные с прошлого запуска."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Сколько рецептов обновлять за один запрос.",
+        )
+
+    def handle(self, *args, **options):
+        popular = refresh_popular_scores(options["batch_size"])
+        trending = refresh_trending_scores(options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Обновлено рейтингов популярности: {popular}, "
+                f"рецептов с новой активностью: {trending}"
+            )
+        )
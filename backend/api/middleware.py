@@ -0,0 +1,186 @@
+import hashlib
+import random
+import time
+from contextlib import ExitStack
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+
+from rest_framework.permissions import SAFE_METHODS
+
+from api.db_routers import reading_from
+
+DEFAULT_STATEMENT_TIMEOUT = "default"
+REPLICA_PIN_KEY = "replica-pin:{}"
+
+
+class ConnectionHealthCheckMiddleware:
+    """Проверяет переиспользуемые соединения, которые долго простаивали.
+
+    При CONN_MAX_AGE > 0 соединение живет между запросами, и за это время
+    его может закрыть сервер, PgBouncer или сеть. Django 3.2 узнает об этом
+    только по ошибке первого запроса к базе, поэтому здесь открытые
+    соединения с CONN_HEALTH_CHECKS, простаивавшие дольше
+    CONN_HEALTH_CHECK_IDLE секунд, проверяются заранее и закрываются, если
+    не отвечают: следующий запрос к базе откроет новое.
+
+    Время последнего запроса отмечает execute_wrapper без обращений к
+    базе, так что соединение, которое недавно работало, не проверяется, а
+    простаивающее (например, реплика при небезопасных запросах) —
+    не чаще раза в CONN_HEALTH_CHECK_IDLE секунд.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        now = time.monotonic()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                if connection.settings_dict.get("CONN_HEALTH_CHECKS"):
+                    self.check(connection, now)
+                    stack.enter_context(
+                        connection.execute_wrapper(self.mark_used)
+                    )
+            return self.get_response(request)
+
+    def check(self, connection, now):
+        if connection.connection is None or connection.in_atomic_block:
+            return
+        idle = connection.settings_dict.get("CONN_HEALTH_CHECK_IDLE", 0)
+        if now - getattr(connection, "health_checked_at", 0) < idle:
+            return
+        if connection.is_usable():
+            connection.health_checked_at = now
+        else:
+            connection.close()
+
+    def mark_used(self, execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        context["connection"].health_checked_at = time.monotonic()
+        return result
+
+
+class ReplicaRoutingMiddleware:
+    """Отправляет чтения безопасных запросов в реплику.
+
+    После успешного небезопасного запроса (рецепт, избранное, корзина,
+    подписка и т.д.) клиент на DB_REPLICA_PIN_SECONDS закрепляется за
+    default, чтобы не увидеть состояние до своей записи из отстающей
+    реплики. Клиент определяется по заголовку Authorization или cookie
+    сессии, отметка хранится в кэше и поэтому видна всем процессам.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pin_key = self.get_pin_key(request)
+        if request.method not in SAFE_METHODS:
+            response = self.get_response(request)
+            if pin_key and response.status_code < 400:
+                cache.set(pin_key, True, settings.DB_REPLICA_PIN_SECONDS)
+            return response
+        alias = None
+        if settings.DATABASE_REPLICAS and not (
+            pin_key and cache.get(pin_key)
+        ):
+            alias = random.choice(settings.DATABASE_REPLICAS)
+        with reading_from(alias):
+            return self.get_response(request)
+
+    def get_pin_key(self, request):
+        credentials = request.META.get("HTTP_AUTHORIZATION") or (
+            request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        )
+        if not credentials:
+            return None
+        return REPLICA_PIN_KEY.format(
+            hashlib.sha256(credentials.encode()).hexdigest()
+        )
+
+
+def get_statement_timeout(view_func):
+    """Класс эндпоинта из атрибута statement_timeout view или @action."""
+    initkwargs = getattr(view_func, "initkwargs", {})
+    view_class = getattr(view_func, "cls", None)
+    return initkwargs.get(
+        "statement_timeout",
+        getattr(view_class, "statement_timeout", DEFAULT_STATEMENT_TIMEOUT),
+    )
+
+
+class StatementTimeoutMiddleware:
+    """statement_timeout Postgres по классу эндпоинта из
+    settings.DB_STATEMENT_TIMEOUTS.
+
+    process_view только запоминает класс эндпоинта, а таймаут ставит
+    execute_wrapper соединений Postgres перед запросами, которые view
+    действительно выполняет, в том же обращении к базе (SET и запрос
+    одной строкой). Запросы без обращений к базе ничего не стоят.
+
+    При прямом подключении вне транзакции значение ставится сессионным SET
+    и запоминается для соединения, так что при постоянных соединениях SET
+    повторяется только при смене класса эндпоинта. Оно же действует и на
+    потоковые ответы, которые читают базу уже после выхода из view.
+    Внутри транзакции, если у сессии другое значение, используется
+    SET LOCAL: сессионный SET откатился бы вместе с транзакцией.
+
+    За PgBouncer в режиме transaction сессионный SET достался бы другим
+    клиентам, поэтому значение "default" задается роли в базе
+    (ALTER ROLE ... SET statement_timeout), а для остальных классов каждый
+    запрос получает SET LOCAL; запрос вне транзакции для этого
+    выполняется в своей транзакции. Потоковая часть ответа в этом режиме
+    выполняется уже с таймаутом роли.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.statement_timeout = None
+        with ExitStack() as stack:
+            for connection in connections.all():
+                if connection.vendor == "postgresql":
+                    stack.enter_context(
+                        connection.execute_wrapper(
+                            partial(self.apply_timeout, request)
+                        )
+                    )
+            return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.statement_timeout = get_statement_timeout(view_func)
+        return None
+
+    def apply_timeout(self, request, execute, sql, params, many, context):
+        timeout_class = request.statement_timeout
+        if timeout_class is None:
+            return execute(sql, params, many, context)
+        timeout = int(settings.DB_STATEMENT_TIMEOUTS[timeout_class])
+        connection = context["connection"]
+        if connection.settings_dict.get("TRANSACTION_POOLING"):
+            if timeout_class == DEFAULT_STATEMENT_TIMEOUT:
+                return execute(sql, params, many, context)
+            sql = f"SET LOCAL statement_timeout = {timeout}; {sql}"
+            if connection.in_atomic_block:
+                return execute(sql, params, many, context)
+            with transaction.atomic(using=connection.alias):
+                return execute(sql, params, many, context)
+        applied = (connection.connection, timeout)
+        if getattr(connection, "applied_statement_timeout", None) == applied:
+            return execute(sql, params, many, context)
+        if connection.in_atomic_block:
+            return execute(
+                f"SET LOCAL statement_timeout = {timeout}; {sql}",
+                params,
+                many,
+                context,
+            )
+        result = execute(
+            f"SET statement_timeout = {timeout}; {sql}", params, many, context
+        )
+        connection.applied_statement_timeout = applied
+        return result
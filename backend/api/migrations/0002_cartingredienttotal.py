@@ -0,0 +1,61 @@
+# Generated by Django 3.2.3 on 2026-10-17 23:08
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+import django.db.models.deletion
+
+
+def fill_cart_totals(apps, schema_editor):
+    AmountIngredientInRecipe = apps.get_model(
+        'api', 'AmountIngredientInRecipe'
+    )
+    CartIngredientTotal = apps.get_model('api', 'CartIngredientTotal')
+    totals = (
+        AmountIngredientInRecipe.objects.filter(recipe__in_cart__isnull=False)
+        .values('recipe__in_cart__user', 'ingredients')
+        .annotate(total_amount=Sum('amount'))
+        .order_by()
+    )
+    CartIngredientTotal.objects.bulk_create(
+        (
+            CartIngredientTotal(
+                user_id=row['recipe__in_cart__user'],
+                ingredient_id=row['ingredients'],
+                total_amount=row['total_amount'],
+            )
+            for row in totals.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartIngredientTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_amount', models.PositiveIntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_totals', to='api.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_totals', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Ингредиент в списке покупок',
+                'verbose_name_plural': 'Список покупок',
+                'ordering': ('user', 'ingredient'),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='cartingredienttotal',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique cart ingredient'),
+        ),
+        migrations.RunPython(
+            fill_cart_totals, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.3 on 2026-10-17 23:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_ingredient_name_trgm'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['name', 'measurement_unit'], name='ingredient_name_unit_idx'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 3.2.3 on 2026-10-17 23:23
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('Recipe', 'favorites_count', 'Favorite', 'recipe'),
+    ('Recipe', 'in_carts_count', 'Cart', 'recipe'),
+    ('FootgramUser', 'recipes_count', 'Recipe', 'author'),
+    ('FootgramUser', 'followers_count', 'Follow', 'author'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for model_name, field, child_name, fk in COUNTERS:
+        model = apps.get_model('api', model_name)
+        child = apps.get_model('api', child_name)
+        counts = (
+            child.objects.filter(**{fk: OuterRef('pk')})
+            .order_by()
+            .values(fk)
+            .annotate(count=Count('pk'))
+            .values('count')
+        )
+        model.objects.update(**{field: Coalesce(Subquery(counts), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='footgramuser',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество подписчиков'),
+        ),
+        migrations.AddField(
+            model_name='footgramuser',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество рецептов'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В корзинах'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+from django.db import migrations
+
+INGREDIENT_NAMES = (
+    'SELECT {aggregate} FROM api_amountingredientinrecipe AS amount '
+    'JOIN api_ingredient AS ingredient '
+    'ON ingredient.id = amount.ingredients_id '
+    'WHERE amount.recipe_id = api_recipe.id'
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'ALTER TABLE api_recipe ADD COLUMN search_vector tsvector'
+        )
+        schema_editor.execute(
+            'UPDATE api_recipe SET search_vector = '
+            "setweight(to_tsvector('russian', name), 'A') || "
+            "setweight(to_tsvector('russian', coalesce(({}), '')), 'B') || "
+            "setweight(to_tsvector('russian', text), 'C')".format(
+                INGREDIENT_NAMES.format(
+                    aggregate="string_agg(ingredient.name, ' ')"
+                )
+            )
+        )
+        schema_editor.execute(
+            'CREATE INDEX api_recipe_search_vector '
+            'ON api_recipe USING gin (search_vector)'
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE api_recipe_fts '
+            'USING fts5(name, ingredients, text)'
+        )
+        schema_editor.execute(
+            'INSERT INTO api_recipe_fts (rowid, name, ingredients, text) '
+            "SELECT id, name, coalesce(({}), ''), text "
+            'FROM api_recipe'.format(
+                INGREDIENT_NAMES.format(
+                    aggregate="group_concat(ingredient.name, ' ')"
+                )
+            )
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'ALTER TABLE api_recipe DROP COLUMN search_vector'
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE api_recipe_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_timeline'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
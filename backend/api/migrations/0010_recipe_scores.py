@@ -0,0 +1,71 @@
+# Generated by Django 3.2.3 on 2026-10-17 23:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+FAVORITE_SCORE_WEIGHT = 1.0
+CART_SCORE_WEIGHT = 2.0
+
+
+def create_scores(apps, schema_editor):
+    Recipe = apps.get_model('api', 'Recipe')
+    RecipeScore = apps.get_model('api', 'RecipeScore')
+    RecipeScore.objects.bulk_create(
+        (
+            RecipeScore(
+                recipe_id=recipe_id,
+                popular_score=favorites_count * FAVORITE_SCORE_WEIGHT
+                + in_carts_count * CART_SCORE_WEIGHT,
+            )
+            for recipe_id, favorites_count, in_carts_count in (
+                Recipe.objects.values_list(
+                    'id', 'favorites_count', 'in_carts_count'
+                ).iterator()
+            )
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_recipe_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeScore',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='score', serialize=False, to='api.recipe', verbose_name='Рецепт')),
+                ('popular_score', models.FloatField(default=0, verbose_name='Популярность')),
+                ('trending_score', models.FloatField(default=0, verbose_name='Популярность сейчас')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг рецепта',
+                'verbose_name_plural': 'Рейтинги рецептов',
+            },
+        ),
+        migrations.CreateModel(
+            name='ScoreRefresh',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_favorite_id', models.PositiveBigIntegerField(default=0)),
+                ('last_cart_id', models.PositiveBigIntegerField(default=0)),
+                ('refreshed_at', models.DateTimeField(verbose_name='Дата пересчета')),
+            ],
+            options={
+                'verbose_name': 'Пересчет рейтингов',
+                'verbose_name_plural': 'Пересчеты рейтингов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recipescore',
+            index=models.Index(fields=['-popular_score', '-recipe'], name='score_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipescore',
+            index=models.Index(fields=['-trending_score', '-recipe'], name='score_trending_idx'),
+        ),
+        migrations.RunPython(create_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 3.2.3 on 2026-10-17 12:40
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """Оставляет у каждой пары (name, measurement_unit) ингредиент с
+    наименьшим id и переносит на него ссылки дублей.
+    """
+    Ingredient = apps.get_model('api', 'Ingredient')
+    AmountIngredientInRecipe = apps.get_model(
+        'api', 'AmountIngredientInRecipe'
+    )
+    CartIngredientTotal = apps.get_model('api', 'CartIngredientTotal')
+    duplicates = (
+        Ingredient.objects.values('name', 'measurement_unit')
+        .annotate(keep_id=Min('id'), copies=Count('id'))
+        .filter(copies__gt=1)
+        .order_by()
+    )
+    for row in duplicates:
+        extra_ids = list(
+            Ingredient.objects.filter(
+                name=row['name'], measurement_unit=row['measurement_unit']
+            )
+            .exclude(id=row['keep_id'])
+            .values_list('id', flat=True)
+        )
+        AmountIngredientInRecipe.objects.filter(
+            ingredients_id__in=extra_ids
+        ).update(ingredients_id=row['keep_id'])
+        for total in CartIngredientTotal.objects.filter(
+            ingredient_id__in=extra_ids
+        ):
+            kept, created = CartIngredientTotal.objects.get_or_create(
+                user_id=total.user_id,
+                ingredient_id=row['keep_id'],
+                defaults={'total_amount': total.total_amount},
+            )
+            if not created:
+                kept.total_amount += total.total_amount
+                kept.save(update_fields=['total_amount'])
+            total.delete()
+        Ingredient.objects.filter(id__in=extra_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_recipe_scores'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+    ]
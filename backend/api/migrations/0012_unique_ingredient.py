@@ -0,0 +1,23 @@
+# Generated by Django 3.2.3 on 2026-10-17 12:40
+
+from django.db import migrations, models
+
+
+# Отдельно от 0011: в Postgres ALTER TABLE нельзя выполнить в той же
+# транзакции, где остались отложенные проверки внешних ключей.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_merge_duplicate_ingredients'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='ingredient',
+            name='ingredient_name_unit_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique ingredient'),
+        ),
+    ]
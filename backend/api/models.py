@@ -40,6 +40,16 @@ class FootgramUser(AbstractUser):
         "Активирован",
         default=True,
     )
+    recipes_count = models.PositiveIntegerField(
+        "Количество рецептов",
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        "Количество подписчиков",
+        default=0,
+        editable=False,
+    )
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username", "first_name", "last_name"]
 
@@ -76,6 +86,11 @@ class Follow(models.Model):
                 name="unique follow",
             )
         ]
+        indexes = [
+            models.Index(
+                fields=["author", "user"], name="follow_author_user_idx"
+            )
+        ]
 
     def __str__(self):
         return self.user.username
@@ -127,6 +142,12 @@ class Ingredient(models.Model):
         verbose_name = "Ингридиент"
         verbose_name_plural = "Ингридиенты"
         ordering = ("name",)
+        constraints = [
+            models.UniqueConstraint(
+                fields=["name", "measurement_unit"],
+                name="unique ingredient",
+            )
+        ]
 
     def __str__(self):
         return f"{self.name}, {self.measurement_unit}"
@@ -158,6 +179,10 @@ class Recipe(models.Model):
         auto_now_add=True,
         editable=False,
     )
+    updated_at = models.DateTimeField(
+        verbose_name="Дата изменения",
+        auto_now=True,
+    )
     image = models.ImageField(
         verbose_name="Изображение блюда",
         upload_to="picture_for_recipe/",
@@ -172,11 +197,30 @@ class Recipe(models.Model):
             ),
         ),
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name="В избранном",
+        default=0,
+        editable=False,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name="В корзинах",
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
         ordering = ("-pub_date",)
+        indexes = [
+            models.Index(
+                fields=["-pub_date", "-id"], name="recipe_pub_date_idx"
+            ),
+            models.Index(
+                fields=["author", "-pub_date", "-id"],
+                name="recipe_author_pub_date_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.name}. Автор: {self.author.username}"
@@ -209,6 +253,12 @@ class AmountIngredientInRecipe(models.Model):
         verbose_name = "Ингридиент"
         verbose_name_plural = "Количество ингридиентов"
         ordering = ("recipe",)
+        indexes = [
+            models.Index(
+                fields=["recipe", "ingredients", "amount"],
+                name="amount_recipe_ingredient_idx",
+            )
+        ]
 
     def __str__(self):
         return f"{self.amount} {self.ingredients}"
@@ -234,6 +284,11 @@ class CartFavoriteModel(models.Model):
                 fields=["user", "recipe"], name="%(class)s_unique_user"
             )
         ]
+        indexes = [
+            models.Index(
+                fields=["recipe", "user"], name="%(class)s_recipe_user_idx"
+            )
+        ]
 
     def __str__(self):
         return self.user.username
@@ -253,3 +308,113 @@ class Favorite(CartFavoriteModel):
         verbose_name = "Избранное"
         verbose_name_plural = "Избранные"
         default_related_name = "favorites"
+
+
+class CartIngredientTotal(models.Model):
+    user = models.ForeignKey(
+        FootgramUser,
+        on_delete=models.CASCADE,
+        verbose_name="Пользователь",
+        related_name="cart_totals",
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name="Ингредиент",
+        related_name="cart_totals",
+    )
+    total_amount = models.PositiveIntegerField(verbose_name="Количество")
+
+    class Meta:
+        verbose_name = "Ингредиент в списке покупок"
+        verbose_name_plural = "Список покупок"
+        ordering = ("user", "ingredient")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "ingredient"],
+                name="unique cart ingredient",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.total_amount} {self.ingredient}"
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        FootgramUser,
+        on_delete=models.CASCADE,
+        verbose_name="Пользователь",
+        related_name="timeline",
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name="Рецепт",
+        related_name="timeline_entries",
+    )
+    pub_date = models.DateTimeField(verbose_name="Дата публикации")
+
+    class Meta:
+        verbose_name = "Рецепт в ленте"
+        verbose_name_plural = "Лента подписок"
+        ordering = ("-pub_date", "-recipe")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "recipe"],
+                name="unique timeline entry",
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "-pub_date", "-recipe"],
+                name="timeline_user_pub_date_idx",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.recipe}"
+
+
+class RecipeScore(models.Model):
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        verbose_name="Рецепт",
+        related_name="score",
+    )
+    popular_score = models.FloatField("Популярность", default=0)
+    trending_score = models.FloatField("Популярность сейчас", default=0)
+
+    class Meta:
+        verbose_name = "Рейтинг рецепта"
+        verbose_name_plural = "Рейтинги рецептов"
+        indexes = [
+            models.Index(
+                fields=["-popular_score", "-recipe"],
+                name="score_popular_idx",
+            ),
+            models.Index(
+                fields=["-trending_score", "-recipe"],
+                name="score_trending_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.recipe} {self.popular_score}"
+
+
+class ScoreRefresh(models.Model):
+    """Докуда refresh_recipe_scores уже учел избранное и корзины."""
+
+    last_favorite_id = models.PositiveBigIntegerField(default=0)
+    last_cart_id = models.PositiveBigIntegerField(default=0)
+    refreshed_at = models.DateTimeField("Дата пересчета")
+
+    class Meta:
+        verbose_name = "Пересчет рейтингов"
+        verbose_name_plural = "Пересчеты рейтингов"
+
+    def __str__(self):
+        return str(self.refreshed_at)
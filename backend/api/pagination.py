@@ -1,6 +1,219 @@
+import base64
+import heapq
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import F, Model, Q
+
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from api import const
+
+
+def estimate_count(queryset):
+    """Оценка числа строк по статистике планировщика.
+
+    Доступна только на PostgreSQL, на остальных базах возвращает None.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
 
 
 class LimitPage(PageNumberPagination):
+    """Постраничная пагинация с режимом курсора.
+
+    По умолчанию работает как раньше: ?page=N и точный count. Если в
+    запросе есть ?cursor (пустой для первой страницы), страница
+    выбирается по ключу keyset без OFFSET и COUNT(*), поэтому глубокие
+    страницы стоят столько же, сколько первая. Точное число записей в
+    этом режиме не считается, ?count=estimate добавляет оценку
+    планировщика (только PostgreSQL).
+    """
+
     page_size = 6
     page_size_query_param = "limit"
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+    invalid_cursor_message = "Неверный курсор."
+    # Поля ключа, по всем сортировка идет по убыванию. Последнее поле
+    # должно быть уникальным.
+    keyset = ("id",)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        page_size = self.get_page_size(request)
+        self.count = None
+        if request.query_params.get(self.count_query_param) == "estimate":
+            self.count = estimate_count(queryset)
+        keyset = self.get_keyset(request)
+        page = self.get_keyset_rows(
+            queryset, keyset, self.decode_cursor(request), page_size + 1
+        )
+        return self.cut_page(page, page_size, keyset)
+
+    def get_keyset(self, request):
+        return self.keyset
+
+    def get_keyset_rows(self, queryset, keyset, position, limit):
+        """Первые limit строк после position в порядке убывания keyset.
+
+        Значения ключа добавляются к строкам аннотациями cursor_N.
+        """
+        names = self.cursor_names(keyset)
+        queryset = queryset.annotate(
+            **{name: F(field) for name, field in zip(names, keyset)}
+        ).order_by(*(f"-{name}" for name in names))
+        if position is not None:
+            try:
+                queryset = queryset.filter(self.after(names, position))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+        return list(queryset[:limit])
+
+    def cut_page(self, page, page_size, keyset):
+        self.has_next = len(page) > page_size
+        page = page[:page_size]
+        self.next_position = None
+        if self.has_next:
+            self.next_position = self.get_position(
+                page[-1], self.cursor_names(keyset)
+            )
+        return page
+
+    def cursor_names(self, keyset):
+        return [f"cursor_{index}" for index in range(len(keyset))]
+
+    def after(self, names, position):
+        """Условие «строго после position» для сортировки по убыванию."""
+        condition = Q()
+        for index in reversed(range(len(names))):
+            equal = {
+                name: value
+                for name, value in zip(names[:index], position[:index])
+            }
+            condition |= Q(
+                **equal, **{f"{names[index]}__lt": position[index]}
+            )
+        return condition
+
+    def get_position(self, item, names):
+        if isinstance(item, Model):
+            values = [getattr(item, name) for name in names]
+        else:
+            # values_list: аннотации добавляются в конец строки.
+            values = list(item[-len(names):])
+        return [
+            value.isoformat() if hasattr(value, "isoformat") else value
+            for value in values
+        ]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(
+            self.get_keyset(request)
+        ):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_cursor(self, position):
+        return base64.urlsafe_b64encode(
+            json.dumps(position).encode()
+        ).decode()
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.next_position),
+        )
+
+    def get_page_state(self):
+        """То, от чего кроме строк страницы зависит ответ (для ETag)."""
+        if self.cursor_mode:
+            return (self.has_next, self.count)
+        return (self.page.paginator.count,)
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        response = OrderedDict(next=self.get_next_link(), results=data)
+        if self.count is not None:
+            response["count"] = self.count
+            response.move_to_end("count", last=False)
+        return Response(response)
+
+
+class RecipePage(LimitPage):
+    keyset = ("pub_date", "id")
+
+    def get_keyset(self, request):
+        return const.RECIPE_ORDERINGS.get(
+            request.query_params.get("ordering"), self.keyset
+        )
+
+
+class SubscriptionPage(LimitPage):
+    keyset = ("following__id",)
+
+
+class FeedPage(LimitPage):
+    """Лента подписок: всегда в режиме курсора.
+
+    Вместо queryset принимает список пар (queryset, keyset), где каждый
+    queryset выбирает id рецептов, а keyset указывает его поля
+    (pub_date, id). Страница сливается из первых строк каждой выборки.
+    """
+
+    keyset = ("pub_date", "id")
+
+    def paginate_queryset(self, sources, request, view=None):
+        self.request = request
+        self.cursor_mode = True
+        self.count = None
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+        rows = heapq.merge(
+            *(
+                self.get_keyset_rows(
+                    queryset, keyset, position, page_size + 1
+                )
+                for queryset, keyset in sources
+            ),
+            key=lambda row: row[-len(self.keyset):],
+            reverse=True,
+        )
+        page = []
+        seen = set()
+        for row in rows:
+            if row[0] not in seen:
+                seen.add(row[0])
+                page.append(row)
+            if len(page) > page_size:
+                break
+        return self.cut_page(page, page_size, self.keyset)
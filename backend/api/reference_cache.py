@@ -0,0 +1,99 @@
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+from api import const
+from api.models import Ingredient, Tag
+
+
+def shared_version(version_key):
+    """Версия из общего кэша; при первом обращении она создается."""
+    version = cache.get(version_key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(version_key, version, None):
+            version = cache.get(version_key)
+    return version
+
+
+class VersionedCache:
+    """Снимок справочника в памяти процесса.
+
+    Версия снимка хранится в общем кэше (settings.CACHES) и меняется при
+    любом изменении справочника, поэтому каждый воркер замечает, что его
+    копия устарела, и перечитывает таблицу. Общая версия сверяется не чаще
+    раза в REFERENCE_VERSION_CHECK_INTERVAL секунд.
+    """
+
+    def __init__(self, name, loader):
+        self.version_key = f"reference:{name}:version"
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0
+        self._data = None
+        self._derived = {}
+
+    def invalidate(self):
+        """Сбрасывает снимок только в текущем процессе."""
+        with self._lock:
+            self._data = None
+            self._derived = {}
+
+    def bump_version(self):
+        cache.set(self.version_key, uuid.uuid4().hex, None)
+        self.invalidate()
+
+    def get(self, check_version=False):
+        """Снимок справочника.
+
+        check_version=True сверяет версию сразу, не дожидаясь интервала:
+        так промах по снимку перечитывает таблицу, только если справочник
+        действительно менялся, то есть не чаще раза на версию.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if (
+                self._data is not None
+                and not check_version
+                and now - self._checked_at
+                < const.REFERENCE_VERSION_CHECK_INTERVAL
+            ):
+                return self._data
+            version = shared_version(self.version_key)
+            self._checked_at = now
+            if self._data is None or version != self._version:
+                self._data = self.loader()
+                self._version = version
+                self._derived = {}
+            return self._data
+
+    def version(self):
+        """Версия снимка, с которой работает текущий процесс."""
+        self.get()
+        return self._version
+
+    def derived(self, name, build, check_version=False):
+        """Значение build(данные), пересчитываемое раз на версию."""
+        data = self.get(check_version)
+        with self._lock:
+            if name not in self._derived:
+                self._derived[name] = build(data)
+            return self._derived[name]
+
+
+tag_cache = VersionedCache("tags", lambda: list(Tag.objects.all()))
+ingredient_cache = VersionedCache(
+    "ingredients", lambda: list(Ingredient.objects.all())
+)
+
+
+def bump_on_commit(reference_cache):
+    transaction.on_commit(reference_cache.bump_version)
+
+
+def by_id(objs):
+    return {obj.id: obj for obj in objs}
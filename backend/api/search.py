@@ -0,0 +1,212 @@
+import re
+from bisect import bisect_left
+
+from django.db import connection, connections, transaction
+from django.db.models import Case, FloatField, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+from api import const
+from api.models import Ingredient
+from api.reference_cache import ingredient_cache
+
+
+class IngredientIndex:
+    """Отсортированный по имени индекс справочника ингредиентов в памяти.
+
+    Префиксные совпадения ищутся бинарным поиском, вхождения — проходом
+    по ключам. Регистр сравнивается через casefold, поэтому поиск
+    работает и для кириллицы, в отличие от LIKE в SQLite.
+    """
+
+    def __init__(self, ingredients):
+        entries = sorted(
+            (
+                (ingredient.name.casefold(), ingredient)
+                for ingredient in ingredients
+            ),
+            key=lambda entry: (
+                entry[0],
+                entry[1].measurement_unit,
+                entry[1].id,
+            ),
+        )
+        self.keys = [key for key, _ in entries]
+        self.ingredients = [ingredient for _, ingredient in entries]
+
+    def search(self, name, limit):
+        keys, ingredients = self.keys, self.ingredients
+        query = name.strip().casefold()
+        if not query:
+            return ingredients[:limit]
+        result = []
+        start = bisect_left(keys, query)
+        for position in range(start, len(keys)):
+            if len(result) >= limit or not keys[position].startswith(query):
+                break
+            result.append(ingredients[position])
+        for key, ingredient in zip(keys, ingredients):
+            if len(result) >= limit:
+                break
+            if query in key and not key.startswith(query):
+                result.append(ingredient)
+        return result
+
+
+def _search_in_database(name, limit):
+    queryset = Ingredient.objects.all()
+    name = name.strip()
+    if name:
+        queryset = (
+            queryset.filter(name__icontains=name)
+            .annotate(
+                rank=Case(
+                    When(name__istartswith=name, then=Value(0)),
+                    default=Value(1),
+                    output_field=IntegerField(),
+                )
+            )
+            .order_by("rank", "name", "measurement_unit")
+        )
+    return list(queryset[:limit])
+
+
+def search_ingredients(name, limit=const.INGREDIENT_SEARCH_LIMIT):
+    """Ингредиенты, начинающиеся с name, затем содержащие name.
+
+    На PostgreSQL поиск идет по триграммному индексу, на остальных базах —
+    по индексу в памяти процесса поверх ingredient_cache.
+    """
+    if connection.vendor == "postgresql":
+        return _search_in_database(name, limit)
+    index = ingredient_cache.derived("index", IngredientIndex)
+    return index.search(name, limit)
+
+
+RECIPE_FTS_TABLE = "api_recipe_fts"
+_INGREDIENT_NAMES = (
+    "SELECT {aggregate} FROM api_amountingredientinrecipe AS amount "
+    "JOIN api_ingredient AS ingredient "
+    "ON ingredient.id = amount.ingredients_id "
+    "WHERE amount.recipe_id = api_recipe.id"
+)
+_POSTGRESQL_INDEX_SQL = (
+    "UPDATE api_recipe SET search_vector = "
+    "setweight(to_tsvector('russian', name), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(({ingredients}), '')), 'B') "
+    "|| setweight(to_tsvector('russian', text), 'C') "
+    "WHERE id = ANY(%s)"
+).format(
+    ingredients=_INGREDIENT_NAMES.format(
+        aggregate="string_agg(ingredient.name, ' ')"
+    )
+)
+_SQLITE_INDEX_SQL = (
+    f"INSERT INTO {RECIPE_FTS_TABLE} (rowid, name, ingredients, text) "
+    "SELECT id, name, coalesce(({ingredients}), ''), text FROM api_recipe "
+    "WHERE id IN ({{placeholders}})"
+).format(
+    ingredients=_INGREDIENT_NAMES.format(
+        aggregate="group_concat(ingredient.name, ' ')"
+    )
+)
+# Максимум параметров в одном запросе SQLite.
+_SQLITE_BATCH_SIZE = 500
+
+
+def index_recipes(recipe_ids):
+    """Пересобирает поисковый индекс для рецептов recipe_ids.
+
+    На PostgreSQL это колонка api_recipe.search_vector, на SQLite —
+    таблица FTS5 api_recipe_fts с rowid, равным id рецепта.
+    """
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(_POSTGRESQL_INDEX_SQL, [recipe_ids])
+        elif connection.vendor == "sqlite":
+            for start in range(0, len(recipe_ids), _SQLITE_BATCH_SIZE):
+                batch = recipe_ids[start:start + _SQLITE_BATCH_SIZE]
+                placeholders = ", ".join(["%s"] * len(batch))
+                cursor.execute(
+                    f"DELETE FROM {RECIPE_FTS_TABLE} "
+                    f"WHERE rowid IN ({placeholders})",
+                    batch,
+                )
+                cursor.execute(
+                    _SQLITE_INDEX_SQL.format(placeholders=placeholders),
+                    batch,
+                )
+
+
+def reindex_on_commit(recipe_ids):
+    """Обновляет индекс, когда транзакция с изменениями завершится.
+
+    Ингредиенты, записанные в той же транзакции после рецепта, к этому
+    моменту уже на месте. Вне транзакции (autocommit) индекс обновляется
+    сразу, поэтому отдельные изменения AmountIngredientInRecipe
+    переиндексируют рецепт своими сигналами.
+    """
+    recipe_ids = list(recipe_ids)
+    transaction.on_commit(lambda: index_recipes(recipe_ids))
+
+
+def remove_from_index(recipe_id):
+    """Убирает удаленный рецепт из FTS5 (на PostgreSQL не требуется)."""
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {RECIPE_FTS_TABLE} WHERE rowid = %s", [recipe_id]
+        )
+
+
+def search_recipes(queryset, query):
+    """Рецепты, в названии, описании или ингредиентах которых есть query.
+
+    Каждое слово запроса ищется как префикс, результаты сортируются по
+    релевантности (название важнее ингредиентов, ингредиенты — описания).
+    """
+    terms = re.findall(r"\w+", query.casefold())[
+        :const.RECIPE_SEARCH_MAX_TERMS
+    ]
+    if not terms:
+        return queryset
+    vendor = connections[queryset.db].vendor
+    if vendor == "postgresql":
+        tsquery = " & ".join(f"{term}:*" for term in terms)
+        matched = RawSQL(
+            "SELECT id FROM api_recipe "
+            "WHERE search_vector @@ to_tsquery('russian', %s)",
+            [tsquery],
+        )
+        rank = RawSQL(
+            "ts_rank(api_recipe.search_vector, to_tsquery('russian', %s))",
+            [tsquery],
+            output_field=FloatField(),
+        )
+    elif vendor == "sqlite":
+        match = " ".join(f'"{term}"*' for term in terms)
+        matched = RawSQL(
+            f"SELECT rowid FROM {RECIPE_FTS_TABLE} "
+            f"WHERE {RECIPE_FTS_TABLE} MATCH %s",
+            [match],
+        )
+        rank = RawSQL(
+            f"(SELECT -bm25({RECIPE_FTS_TABLE}, 10.0, 4.0, 1.0) "
+            f"FROM {RECIPE_FTS_TABLE} WHERE {RECIPE_FTS_TABLE} MATCH %s "
+            "AND rowid = api_recipe.id)",
+            [match],
+            output_field=FloatField(),
+        )
+    else:
+        condition = Q()
+        for term in terms:
+            condition &= Q(name__icontains=term) | Q(text__icontains=term)
+        return queryset.filter(condition)
+    return (
+        queryset.filter(id__in=matched)
+        .annotate(search_rank=rank)
+        .order_by("-search_rank", "-pub_date", "-id")
+    )
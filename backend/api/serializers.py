@@ -1,13 +1,24 @@
+import json
+
 from django.contrib.auth import get_user_model
-from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import F
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+from django.http import QueryDict
 
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
-from rest_framework.generics import get_object_or_404
 
-from api import models, validators
+from api import (
+    business_logic,
+    const,
+    images,
+    models,
+    reference_cache,
+    uploads,
+    validators
+)
+from api.viewer_state import get_viewer_state
 
 User = get_user_model()
 
@@ -41,10 +52,8 @@ class FoodgramUserSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        user = self.context.get("request").user
-        if user.is_anonymous:
-            return False
-        return models.Follow.objects.filter(user=user, author=obj.id).exists()
+        request = self.context.get("request")
+        return obj.id in get_viewer_state(request).following_ids
 
 
 class CartOrFavoriteerializer(serializers.ModelSerializer):
@@ -53,22 +62,6 @@ class CartOrFavoriteerializer(serializers.ModelSerializer):
     name = serializers.ReadOnlyField(source="recipe.name")
     cooking_time = serializers.ReadOnlyField(source="recipe.cooking_time")
 
-    def validate(self, data):
-        user = self.context.get("user")
-        recipe_id = self.context.get("recipe")
-        models_for_valid = self.context.get("model")
-        try:
-            recipe = models.Recipe.objects.get(id=recipe_id)
-        except ObjectDoesNotExist:
-            raise serializers.ValidationError({"recipe": "Рецепт не найден"})
-        if models_for_valid.objects.filter(user=user, recipe=recipe).exists():
-            raise serializers.ValidationError(
-                {"errors": "Рецепт уже добавлен в список"}
-            )
-        data["user"] = user
-        data["recipe"] = recipe
-        return data
-
 
 class CartRecipeSerializer(CartOrFavoriteerializer):
 
@@ -85,11 +78,26 @@ class FavoriteSerializer(CartOrFavoriteerializer):
         fields = ("id", "name", "image", "cooking_time")
 
 
+class BulkRecipesSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=const.MAX_BULK_RECIPES,
+    )
+
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
+
+
 class CropRecipeSerializer(serializers.ModelSerializer):
+    images = serializers.SerializerMethodField()
 
     class Meta:
         model = models.Recipe
-        fields = ("id", "name", "image", "cooking_time")
+        fields = ("id", "name", "image", "images", "cooking_time")
+
+    def get_images(self, obj):
+        return images.variant_urls(obj.image, self.context.get("request"))
 
 
 class FollowSerializer(serializers.ModelSerializer):
@@ -116,49 +124,33 @@ class FollowSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        return models.Follow.objects.filter(
-            user=obj.user, author=obj.author
-        ).exists()
+        # Сериализуется только что созданная подписка.
+        return True
 
     def get_recipes(self, obj):
-        limit = self.context.get("limit")
-        queryset = models.Recipe.objects.filter(author=obj.author)
-        if limit:
-            queryset = queryset[: int(limit)]
-        return CropRecipeSerializer(queryset, many=True).data
+        """Рецепты из business_logic.attach_limited_recipes."""
+        return CropRecipeSerializer(
+            obj.author.limited_recipes, many=True, context=self.context
+        ).data
 
     def get_recipes_count(self, obj):
-        return models.Recipe.objects.filter(author=obj.author).count()
-
-    def create(self, validated_data):
-        user = self.context["user"]
-        author = self.context["author"]
-        follow = models.Follow.objects.create(user=user, author=author)
-        return follow
-
+        return obj.author.recipes_count
 
-class AuthorUserSerializer(serializers.ModelSerializer):
 
-    class Meta:
-        model = models.Follow
-        fields = ("user", "author")
+class SubscriptionSerializer(FoodgramUserSerializer):
+    recipes = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(read_only=True)
 
-    def validate(self, data):
-        user = data["user"]
-        author = data["author"]
-        if user == author:
-            raise serializers.ValidationError(
-                {"error": "Вы не можете подписываться на самого себя"}
-            )
-        if models.Follow.objects.filter(user=user, author=author).exists():
-            raise serializers.ValidationError(
-                {"error": "Вы уже подписаны на этого пользователя"}
-            )
-        return data
+    class Meta(FoodgramUserSerializer.Meta):
+        fields = FoodgramUserSerializer.Meta.fields + (
+            "recipes",
+            "recipes_count",
+        )
 
-    def to_representation(self, instance):
-        serializer = FollowSerializer(instance)
-        return serializer.data
+    def get_recipes(self, obj):
+        return CropRecipeSerializer(
+            obj.limited_recipes, many=True, context=self.context
+        ).data
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -169,6 +161,17 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ("__all__",)
 
 
+def _serialize_tags(tags):
+    return {tag.id: TagSerializer(tag).data for tag in tags}
+
+
+def get_serialized_tags(check_version=False):
+    """Сериализованные тэги из reference_cache по id."""
+    return reference_cache.tag_cache.derived(
+        "serialized", _serialize_tags, check_version
+    )
+
+
 class IngredientSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -189,13 +192,30 @@ class AmountIngredientInRecipeSerializer(serializers.ModelSerializer):
         fields = ("id", "name", "measurement_unit", "amount")
 
 
+class RecipeImageField(Base64ImageField):
+    """Картинка строкой base64 или файлом из multipart-запроса."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, UploadedFile):
+            return uploads.check_image(data)
+        return super().to_internal_value(data)
+
+
+class ImageUploadSerializer(serializers.Serializer):
+    image = RecipeImageField(validators=[validators.NotNullVAlidator()])
+
+
 class RecipeSerializer(serializers.ModelSerializer):
-    image = Base64ImageField(validators=[validators.NotNullVAlidator()])
-    tags = TagSerializer(read_only=True, many=True)
+    image = RecipeImageField(
+        required=False, validators=[validators.NotNullVAlidator()]
+    )
+    image_token = serializers.CharField(write_only=True, required=False)
+    tags = serializers.SerializerMethodField()
     author = FoodgramUserSerializer(read_only=True)
     ingredients = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    images = serializers.SerializerMethodField()
 
     class Meta:
         model = models.Recipe
@@ -206,72 +226,194 @@ class RecipeSerializer(serializers.ModelSerializer):
             "ingredients",
             "is_favorited",
             "is_in_shopping_cart",
+            "favorites_count",
             "name",
             "image",
+            "image_token",
+            "images",
             "text",
             "cooking_time",
         )
 
+    def get_tags(self, recipe):
+        tag_ids = [tag.id for tag in recipe.tags.all()]
+        serialized_tags = get_serialized_tags()
+        if not serialized_tags.keys() >= set(tag_ids):
+            serialized_tags = get_serialized_tags(check_version=True)
+        return [
+            serialized_tags[tag_id]
+            for tag_id in tag_ids
+            if tag_id in serialized_tags
+        ]
+
     def get_ingredients(self, recipe):
-        ingredients = recipe.ingredients.values(
-            "id", "name", "measurement_unit", amount=F("recipe__amount")
-        )
-        return ingredients
+        return [
+            {
+                "id": item.ingredients.id,
+                "name": item.ingredients.name,
+                "measurement_unit": item.ingredients.measurement_unit,
+                "amount": item.amount,
+            }
+            for item in recipe.ingredient.all()
+        ]
+
+    def get_images(self, obj):
+        return images.variant_urls(obj.image, self.context.get("request"))
 
     def get_is_favorited(self, obj):
-        user = self.context.get("request").user
-        if user.is_authenticated:
-            return obj.is_favorited
-        return False
+        request = self.context.get("request")
+        return obj.id in get_viewer_state(request).favorite_ids
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context.get("request").user
-        if user.is_authenticated:
-            return obj.is_in_shopping_cart
-        return False
+        request = self.context.get("request")
+        return obj.id in get_viewer_state(request).cart_ids
+
+    def _initial_list(self, name):
+        """Список из JSON-тела или из поля multipart-запроса.
+
+        В multipart список передается повторяющимся полем (tags=1&tags=2,
+        ingredients={...}&ingredients={...}) или одним полем со строкой
+        JSON (ingredients=[{...}]). Одиночный объект вместо списка
+        считается списком из одного элемента.
+        """
+        if not isinstance(self.initial_data, QueryDict):
+            value = self.initial_data.get(name)
+            return [value] if isinstance(value, dict) else value
+        items = []
+        for value in self.initial_data.getlist(name):
+            try:
+                parsed = json.loads(value)
+            except ValueError:
+                items.append(value)
+                continue
+            if isinstance(parsed, list):
+                items.extend(parsed)
+            else:
+                items.append(parsed)
+        return items
 
     def validate(self, data):
-        ingredients = self.initial_data.get("ingredients")
-        tags = self.initial_data.get("tags")
         validator = validators.RecipeValidator()
-        validator.tag_validation(models.Tag, tags)
-        validator.ingredient_validation(models.Ingredient, ingredients)
-        data["ingredients"] = ingredients
-        data["tags"] = tags
+        data["tags"] = validator.tag_validation(
+            models.Tag, self._initial_list("tags")
+        )
+        data["ingredients"] = validator.ingredient_validation(
+            models.Ingredient, self._initial_list("ingredients")
+        )
+        image_token = data.pop("image_token", None)
+        if image_token is not None:
+            data["image"] = uploads.resolve(
+                image_token, self.context["request"].user
+            )
+        elif self.instance is None and not data.get("image"):
+            raise serializers.ValidationError(
+                {"image": "Картинка не передана"}
+            )
         return data
 
+    def _stage_image(self, validated_data):
+        """Картинка из тела запроса обрабатывается в фоне, как загрузка."""
+        image = validated_data.get("image")
+        if image is not None and not isinstance(image, str):
+            validated_data["image"] = uploads.stage_for_recipe(
+                image, self.context["request"].user
+            )
+
     def set_ingredients(self, recipe, ingredients_data):
-        ingredient_list = []
-        for ingredient in ingredients_data:
-            ingredient_list.append(
-                models.AmountIngredientInRecipe(
-                    recipe=recipe,
-                    ingredients=get_object_or_404(
-                        models.Ingredient, pk=ingredient.get("id")
-                    ),
-                    amount=ingredient.get("amount"),
-                )
+        models.AmountIngredientInRecipe.objects.bulk_create(
+            models.AmountIngredientInRecipe(
+                recipe=recipe, ingredients=ingredient, amount=amount
             )
-        models.AmountIngredientInRecipe.objects.bulk_create(ingredient_list)
+            for ingredient, amount in ingredients_data
+        )
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop("ingredients")
         tags = validated_data.pop("tags")
+        self._stage_image(validated_data)
         recipe = models.Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
         self.set_ingredients(recipe, ingredients_data)
+        uploads.process_on_commit(recipe)
         return recipe
 
+    def _update_tags(self, recipe, tags):
+        current_ids = set(recipe.tags.values_list("id", flat=True))
+        new_ids = {tag.id for tag in tags}
+        if current_ids == new_ids:
+            return False
+        recipe.tags.remove(*(current_ids - new_ids))
+        recipe.tags.add(*(new_ids - current_ids))
+        return True
+
+    def _update_ingredients(self, recipe, ingredients_data, current_rows):
+        new_amounts = {
+            ingredient.id: amount for ingredient, amount in ingredients_data
+        }
+        to_update = []
+        for ingredient_id, row in current_rows.items():
+            amount = new_amounts.get(ingredient_id)
+            if amount is not None and amount != row.amount:
+                row.amount = amount
+                to_update.append(row)
+        to_delete = [
+            row.pk
+            for ingredient_id, row in current_rows.items()
+            if ingredient_id not in new_amounts
+        ]
+        to_create = [
+            (ingredient, amount)
+            for ingredient, amount in ingredients_data
+            if ingredient.id not in current_rows
+        ]
+        if to_delete:
+            models.AmountIngredientInRecipe.objects.filter(
+                pk__in=to_delete
+            ).delete()
+        if to_update:
+            models.AmountIngredientInRecipe.objects.bulk_update(
+                to_update, ["amount"]
+            )
+        if to_create:
+            self.set_ingredients(recipe, to_create)
+        return bool(to_delete or to_update or to_create)
+
+    @transaction.atomic
     def update(self, instance, validated_data):
+        """Записывает только то, что отличается от текущего состояния."""
         tags = validated_data.pop("tags")
         ingredients_data = validated_data.pop("ingredients")
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
-        instance.tags.clear()
-        instance.tags.set(tags)
-        models.AmountIngredientInRecipe.objects.filter(
-            recipe=instance
-        ).all().delete()
-        self.set_ingredients(instance, ingredients_data)
+        self._stage_image(validated_data)
+        current_rows = {
+            row.ingredients_id: row for row in instance.ingredient.all()
+        }
+        old_amounts = {
+            ingredient_id: row.amount
+            for ingredient_id, row in current_rows.items()
+        }
+        changed_fields = [
+            attr
+            for attr, value in validated_data.items()
+            if getattr(instance, attr) != value
+        ]
+        for attr in changed_fields:
+            setattr(instance, attr, validated_data[attr])
+        tags_changed = self._update_tags(instance, tags)
+        ingredients_changed = self._update_ingredients(
+            instance, ingredients_data, current_rows
+        )
+        if changed_fields or tags_changed or ingredients_changed:
+            instance.save(update_fields=[*changed_fields, "updated_at"])
+        if "image" in changed_fields:
+            uploads.process_on_commit(instance)
+        if ingredients_changed:
+            business_logic.change_recipe_in_carts(
+                instance,
+                old_amounts,
+                {
+                    ingredient.id: amount
+                    for ingredient, amount in ingredients_data
+                },
+            )
         return instance
@@ -0,0 +1,127 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from api.authentication import token_cache
+from api.business_logic import change_cart_totals, change_counters
+from api.models import (
+    AmountIngredientInRecipe,
+    Cart,
+    Favorite,
+    Follow,
+    FootgramUser,
+    Ingredient,
+    Recipe,
+    RecipeScore,
+    Tag
+)
+from api.reference_cache import bump_on_commit, ingredient_cache, tag_cache
+from api.search import reindex_on_commit, remove_from_index
+from api.viewer_state import changed_on_commit
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def bump_ingredient_version(**kwargs):
+    bump_on_commit(ingredient_cache)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def bump_tag_version(**kwargs):
+    bump_on_commit(tag_cache)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=Cart)
+@receiver(post_save, sender=Follow)
+@receiver(post_save, sender=Recipe)
+def increment_counters(sender, instance, created, **kwargs):
+    if created:
+        change_counters(sender, [instance], 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=Cart)
+@receiver(post_delete, sender=Follow)
+@receiver(post_delete, sender=Recipe)
+def decrement_counters(sender, instance, **kwargs):
+    change_counters(sender, [instance], -1)
+
+
+@receiver(post_save, sender=Cart)
+def add_to_cart_totals(instance, created, **kwargs):
+    if created:
+        change_cart_totals(instance.user_id, [instance.recipe_id], 1)
+
+
+@receiver(pre_delete, sender=Cart)
+def remove_from_cart_totals(instance, **kwargs):
+    """pre_delete, а не post_delete: при каскадном удалении рецепта его
+    ингредиенты удаляются раньше, чем отправляется post_delete корзины.
+    """
+    change_cart_totals(instance.user_id, [instance.recipe_id], -1)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=Cart)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=Cart)
+@receiver(post_delete, sender=Follow)
+def change_viewer_state(instance, **kwargs):
+    changed_on_commit([instance.user_id])
+
+
+@receiver(post_save, sender=Recipe)
+def reindex_recipe(sender, instance, **kwargs):
+    reindex_on_commit([instance.id])
+
+
+@receiver(post_save, sender=AmountIngredientInRecipe)
+@receiver(post_delete, sender=AmountIngredientInRecipe)
+def reindex_amount_recipe(sender, instance, **kwargs):
+    """Ингредиенты, добавленные или удаленные отдельно от рецепта
+    (скрипты, shell, фикстуры). Сериализатор пишет их bulk-операциями, и
+    рецепт переиндексируется по своему post_save.
+    """
+    reindex_on_commit([instance.recipe_id])
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_from_index(sender, instance, **kwargs):
+    remove_from_index(instance.id)
+
+
+@receiver(post_save, sender=Ingredient)
+def reindex_ingredient_recipes(sender, instance, created, **kwargs):
+    if not created:
+        reindex_on_commit(
+            AmountIngredientInRecipe.objects.filter(
+                ingredients=instance
+            ).values_list("recipe_id", flat=True)
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def create_recipe_score(sender, instance, created, **kwargs):
+    if created:
+        RecipeScore.objects.create(recipe=instance)
+
+
+@receiver(post_delete, sender=Token)
+def revoke_cached_token(**kwargs):
+    bump_on_commit(token_cache)
+
+
+@receiver(post_save, sender=FootgramUser)
+def refresh_cached_user(created, update_fields, **kwargs):
+    """Смена пароля, деактивация или профиля сбрасывает кэш токенов.
+
+    Вход в систему обновляет только last_login, его пропускаем, чтобы
+    каждый логин не сбрасывал кэш во всех воркерах.
+    """
+    if created or update_fields == frozenset({"last_login"}):
+        return
+    bump_on_commit(token_cache)
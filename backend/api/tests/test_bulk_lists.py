@@ -0,0 +1,54 @@
+import pytest
+
+from api.models import Cart, Favorite, Recipe
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def recipes(make_user, make_recipe):
+    author = make_user("author")
+    return [make_recipe(author, name=f"Рецепт {index}") for index in range(3)]
+
+
+@pytest.mark.parametrize(
+    "model, url, counter",
+    [
+        (Favorite, "/api/recipes/favorite/", "favorites_count"),
+        (Cart, "/api/recipes/shopping_cart/", "in_carts_count"),
+    ],
+)
+def test_bulk_add_and_remove(
+    make_user, client_for, recipes, model, url, counter
+):
+    user = make_user("user")
+    client = client_for(user)
+    first, second, third = (recipe.id for recipe in recipes)
+    model.objects.create(user=user, recipe_id=first)
+    missing_id = third + 100
+
+    response = client.post(
+        url, {"recipes": [first, second, missing_id]}, format="json"
+    )
+    assert response.status_code == 200
+    assert response.json() == [
+        {"id": first, "status": "exists"},
+        {"id": second, "status": "added"},
+        {"id": missing_id, "status": "not_found"},
+    ]
+    counts = dict(Recipe.objects.values_list("id", counter))
+    assert counts == {first: 1, second: 1, third: 0}
+
+    response = client.delete(
+        url, {"recipes": [second, third, missing_id]}, format="json"
+    )
+    assert response.json() == [
+        {"id": second, "status": "removed"},
+        {"id": third, "status": "missing"},
+        {"id": missing_id, "status": "not_found"},
+    ]
+    counts = dict(Recipe.objects.values_list("id", counter))
+    assert counts == {first: 1, second: 0, third: 0}
+    assert set(
+        model.objects.filter(user=user).values_list("recipe_id", flat=True)
+    ) == {first}
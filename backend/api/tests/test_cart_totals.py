@@ -0,0 +1,78 @@
+import pytest
+
+from api.business_logic import compute_cart_totals
+from api.models import Cart, CartIngredientTotal
+
+
+def stored_totals(user):
+    return set(
+        CartIngredientTotal.objects.filter(user=user).values_list(
+            "user_id", "ingredient_id", "total_amount"
+        )
+    )
+
+
+def expected_totals(user):
+    return set(compute_cart_totals([user.id]))
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_adds_sharing_new_ingredient(
+    make_user, make_recipe, client_for, run_concurrently
+):
+    buyer = make_user("buyer")
+    author = make_user("author")
+    recipes = [
+        make_recipe(
+            author,
+            name=f"Рецепт {index}",
+            ingredients=[("мука", "г", 100), ("соль", "г", index + 1)],
+        )
+        for index in range(8)
+    ]
+
+    def add(recipe):
+        response = client_for(buyer).post(
+            f"/api/recipes/{recipe.id}/shopping_cart/"
+        )
+        return response.status_code
+
+    statuses = run_concurrently(add, [(recipe,) for recipe in recipes])
+
+    assert statuses == [201] * len(recipes)
+    assert stored_totals(buyer) == expected_totals(buyer)
+
+
+@pytest.mark.django_db
+def test_orm_changes_keep_totals(make_user, make_recipe):
+    buyer = make_user("buyer")
+    author = make_user("author")
+    soup = make_recipe(author, ingredients=[("соль", "г", 5)])
+    salad = make_recipe(
+        author, ingredients=[("соль", "г", 3), ("масло", "мл", 20)]
+    )
+
+    Cart.objects.create(user=buyer, recipe=soup)
+    Cart.objects.create(user=buyer, recipe=salad)
+    assert stored_totals(buyer) == expected_totals(buyer)
+    assert len(stored_totals(buyer)) == 2
+
+    Cart.objects.get(user=buyer, recipe=soup).delete()
+    assert stored_totals(buyer) == expected_totals(buyer)
+
+    salad.delete()
+    assert stored_totals(buyer) == set()
+
+
+@pytest.mark.django_db
+def test_remove_last_recipe_deletes_rows(make_user, make_recipe, client_for):
+    buyer = make_user("buyer")
+    recipe = make_recipe(make_user("author"))
+    client = client_for(buyer)
+
+    client.post(f"/api/recipes/{recipe.id}/shopping_cart/")
+    assert stored_totals(buyer) == expected_totals(buyer) != set()
+
+    response = client.delete(f"/api/recipes/{recipe.id}/shopping_cart/")
+    assert response.status_code == 204
+    assert stored_totals(buyer) == set()
@@ -0,0 +1,30 @@
+import pytest
+
+pytestmark = pytest.mark.django_db
+
+
+def test_recipe_detail_revalidates_by_etag_only(
+    make_user, make_recipe, client_for
+):
+    author = make_user("author")
+    recipe = make_recipe(author)
+    client = client_for()
+    url = f"/api/recipes/{recipe.id}/"
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert "Last-Modified" not in response
+    etag = response["ETag"]
+
+    assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+    # Рецепт не менялся, но его представление включает автора.
+    author.first_name = "Новое имя"
+    author.save()
+    response = client.get(
+        url,
+        HTTP_IF_NONE_MATCH=etag,
+        HTTP_IF_MODIFIED_SINCE="Fri, 01 Jan 2100 00:00:00 GMT",
+    )
+    assert response.status_code == 200
+    assert response.json()["author"]["first_name"] == "Новое имя"
@@ -0,0 +1,29 @@
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from PIL import Image
+
+from api import const, images
+
+
+def test_leftover_variants_are_replaced(media_root, make_jpeg):
+    upload = ContentFile(make_jpeg(), name="photo.jpg")
+    original_name = images.process_recipe_image(upload)
+    directory = original_name.rsplit("/", 1)[0]
+    # Прерванная обработка: оригинала нет, вариант записан не до конца.
+    default_storage.delete(original_name)
+    card_name = f"{directory}/card.webp"
+    default_storage.delete(card_name)
+    default_storage.save(card_name, ContentFile(b"broken"))
+
+    upload.seek(0)
+    assert images.process_recipe_image(upload) == original_name
+
+    with default_storage.open(card_name) as card:
+        with Image.open(card) as image:
+            assert image.size[0] <= const.IMAGE_VARIANTS["card"][0]
+    assert sorted(default_storage.listdir(directory)[1]) == sorted(
+        f"{variant}.{extension}"
+        for variant in const.IMAGE_VARIANTS
+        for extension in images.FORMAT_EXTENSIONS.values()
+    )
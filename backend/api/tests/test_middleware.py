@@ -0,0 +1,110 @@
+from types import SimpleNamespace
+
+from django.db import connections
+
+import pytest
+
+from api.middleware import (
+    ConnectionHealthCheckMiddleware,
+    StatementTimeoutMiddleware
+)
+
+
+class FakeConnection:
+    alias = "default"
+
+    def __init__(self, pooling=False, in_atomic_block=False):
+        self.settings_dict = {"TRANSACTION_POOLING": pooling}
+        self.in_atomic_block = in_atomic_block
+        self.connection = object()
+
+
+def run(connection, timeout_class, sql="SELECT 1"):
+    executed = []
+    middleware = StatementTimeoutMiddleware(lambda request: None)
+    middleware.apply_timeout(
+        SimpleNamespace(statement_timeout=timeout_class),
+        lambda sql, params, many, context: executed.append(sql),
+        sql,
+        None,
+        False,
+        {"connection": connection},
+    )
+    return executed[0]
+
+
+@pytest.fixture(autouse=True)
+def timeouts(settings):
+    settings.DB_STATEMENT_TIMEOUTS = {"default": 5000, "export": 30000}
+
+
+def test_session_timeout_is_set_once_per_connection():
+    connection = FakeConnection()
+
+    assert run(connection, "default") == (
+        "SET statement_timeout = 5000; SELECT 1"
+    )
+    assert run(connection, "default") == "SELECT 1"
+    assert run(connection, "export") == (
+        "SET statement_timeout = 30000; SELECT 1"
+    )
+
+
+def test_transaction_gets_local_timeout():
+    connection = FakeConnection(in_atomic_block=True)
+
+    for _ in range(2):
+        assert run(connection, "export") == (
+            "SET LOCAL statement_timeout = 30000; SELECT 1"
+        )
+    assert not hasattr(connection, "applied_statement_timeout")
+
+
+def test_requests_outside_views_are_untouched():
+    assert run(FakeConnection(), None) == "SELECT 1"
+
+
+@pytest.mark.django_db
+def test_transaction_pooling_uses_local_timeout_only():
+    connection = FakeConnection(pooling=True)
+
+    assert run(connection, "default") == "SELECT 1"
+    assert run(connection, "export") == (
+        "SET LOCAL statement_timeout = 30000; SELECT 1"
+    )
+    assert not hasattr(connection, "applied_statement_timeout")
+
+
+@pytest.mark.django_db(transaction=True)
+def test_health_check_pings_only_idle_connections(monkeypatch):
+    connection = connections["default"]
+    monkeypatch.setitem(connection.settings_dict, "CONN_HEALTH_CHECKS", True)
+    monkeypatch.setitem(connection.settings_dict, "CONN_HEALTH_CHECK_IDLE", 30)
+    pings = []
+    monkeypatch.setattr(
+        connection, "is_usable", lambda: pings.append(1) or True
+    )
+
+    def query(request):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+
+    connection.ensure_connection()
+    monkeypatch.setattr(connection, "health_checked_at", 0, raising=False)
+    middleware = ConnectionHealthCheckMiddleware(query)
+    # Соединение открыто до middleware и еще не отмечено: одна проверка,
+    # дальше запросы отмечают его сами.
+    for _ in range(3):
+        middleware(None)
+    assert pings == [1]
+
+    connection.health_checked_at -= 60
+    idle = ConnectionHealthCheckMiddleware(lambda request: None)
+    for _ in range(3):
+        idle(None)
+    assert pings == [1, 1]
+
+    connection.health_checked_at -= 60
+    monkeypatch.setattr(connection, "is_usable", lambda: False)
+    idle(None)
+    assert connection.connection is None
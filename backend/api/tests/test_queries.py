@@ -0,0 +1,85 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+import pytest
+
+from api.models import Favorite, Follow
+
+pytestmark = pytest.mark.django_db
+
+# Версии для ETag, страница рецептов, тэги, авторы, ингредиенты и
+# счетчик страниц; для деталей рецепта счетчика нет.
+RECIPE_LIST_QUERIES = 6
+RECIPE_DETAIL_QUERIES = 5
+# Счетчик, страница авторов и рецепты всех авторов одним запросом.
+SUBSCRIPTIONS_QUERIES = 3
+
+
+def count_queries(client, url):
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(url)
+    assert response.status_code == 200
+    return len(context), response.json()
+
+
+@pytest.fixture
+def catalog(make_user, make_recipe):
+    viewer = make_user("viewer")
+    authors = [make_user(f"author{index}") for index in range(5)]
+    recipes = [
+        make_recipe(
+            authors[index % len(authors)],
+            name=f"Рецепт {index}",
+            ingredients=[
+                (f"ингредиент {index % 7}", "г", 10),
+                (f"ингредиент {(index + 1) % 7}", "шт", 2),
+            ],
+        )
+        for index in range(60)
+    ]
+    for author in authors[:3]:
+        Follow.objects.create(user=viewer, author=author)
+    Favorite.objects.create(user=viewer, recipe=recipes[0])
+    return viewer, recipes
+
+
+@pytest.mark.parametrize("authenticated", [False, True])
+def test_recipe_list_query_count_does_not_depend_on_page_size(
+    catalog, client_for, authenticated
+):
+    viewer, _ = catalog
+    client = client_for(viewer if authenticated else None)
+    client.get("/api/recipes/?limit=1")
+    small, small_page = count_queries(client, "/api/recipes/?limit=3")
+    large, large_page = count_queries(client, "/api/recipes/?limit=50")
+    assert len(small_page["results"]) == 3
+    assert len(large_page["results"]) == 50
+    assert small == large == RECIPE_LIST_QUERIES
+
+
+def test_recipe_detail_query_count_is_constant(catalog, client_for):
+    viewer, recipes = catalog
+    client = client_for(viewer)
+    client.get(f"/api/recipes/{recipes[0].id}/")
+    counts = {
+        count_queries(client, f"/api/recipes/{recipe.id}/")[0]
+        for recipe in recipes[:5]
+    }
+    assert counts == {RECIPE_DETAIL_QUERIES}
+
+
+def test_subscriptions_query_count_does_not_depend_on_recipes_limit(
+    catalog, client_for
+):
+    viewer, _ = catalog
+    client = client_for(viewer)
+    client.get("/api/users/subscriptions/?recipes_limit=1")
+    small, small_page = count_queries(
+        client, "/api/users/subscriptions/?recipes_limit=3"
+    )
+    large, large_page = count_queries(
+        client, "/api/users/subscriptions/?recipes_limit=50"
+    )
+    assert all(len(author["recipes"]) == 3 for author in small_page["results"])
+    assert all(len(author["recipes"]) > 3 for author in large_page["results"])
+    assert small == large == SUBSCRIPTIONS_QUERIES
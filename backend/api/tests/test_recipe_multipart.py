@@ -0,0 +1,86 @@
+import json
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+import pytest
+
+from api.models import Ingredient, Recipe, Tag
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def catalog():
+    tag = Tag.objects.create(name="Обед", color="#49B64E", slug="lunch")
+    salt = Ingredient.objects.create(name="соль", measurement_unit="г")
+    flour = Ingredient.objects.create(name="мука", measurement_unit="г")
+    return tag, salt, flour
+
+
+def amounts(recipe_id):
+    return dict(
+        Recipe.objects.get(pk=recipe_id).ingredient.values_list(
+            "ingredients_id", "amount"
+        )
+    )
+
+
+def test_multipart_create_and_update_with_ingredient_objects(
+    make_user, client_for, media_root, make_jpeg, catalog
+):
+    tag, salt, flour = catalog
+    client = client_for(make_user("author"))
+
+    response = client.post(
+        "/api/recipes/",
+        {
+            "name": "Суп",
+            "text": "Описание",
+            "cooking_time": 10,
+            "tags": [tag.id],
+            # Повторяющееся поле, по объекту JSON в каждом.
+            "ingredients": [
+                json.dumps({"id": salt.id, "amount": 5}),
+                json.dumps({"id": flour.id, "amount": 200}),
+            ],
+            "image": SimpleUploadedFile(
+                "photo.jpg", make_jpeg(), content_type="image/jpeg"
+            ),
+        },
+        format="multipart",
+    )
+    assert response.status_code == 201, response.json()
+    recipe_id = response.json()["id"]
+    assert amounts(recipe_id) == {salt.id: 5, flour.id: 200}
+
+    response = client.patch(
+        f"/api/recipes/{recipe_id}/",
+        {
+            "tags": [tag.id],
+            # Один объект вместо списка.
+            "ingredients": json.dumps({"id": flour.id, "amount": 300}),
+        },
+        format="multipart",
+    )
+    assert response.status_code == 200, response.json()
+    assert amounts(recipe_id) == {flour.id: 300}
+
+
+@pytest.mark.parametrize(
+    "ingredients", [["соль"], [json.dumps([1, 2])], ["5"]]
+)
+def test_multipart_ingredients_must_be_objects(
+    make_user, make_recipe, client_for, catalog, ingredients
+):
+    author = make_user("author")
+    recipe = make_recipe(author)
+    tag = catalog[0]
+
+    response = client_for(author).patch(
+        f"/api/recipes/{recipe.id}/",
+        {"tags": [tag.id], "ingredients": ingredients},
+        format="multipart",
+    )
+
+    assert response.status_code == 400
+    assert "ingredients" in response.json()
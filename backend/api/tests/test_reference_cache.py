@@ -0,0 +1,31 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+import pytest
+
+from api.filters import get_tag_ids_by_slug
+from api.models import Tag
+
+pytestmark = pytest.mark.django_db
+
+
+def test_unknown_slug_does_not_reload_tags(make_user, make_recipe):
+    make_recipe(make_user("author"))
+    assert "breakfast" in get_tag_ids_by_slug()
+
+    with CaptureQueriesContext(connection) as context:
+        for _ in range(3):
+            assert "missing" not in get_tag_ids_by_slug(["missing"])
+    assert len(context) == 0
+
+
+def test_new_tag_is_found_after_version_change(
+    make_user, make_recipe, django_capture_on_commit_callbacks
+):
+    make_recipe(make_user("author"))
+    get_tag_ids_by_slug()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        Tag.objects.create(name="Ужин", color="#8775D2", slug="dinner")
+
+    assert "dinner" in get_tag_ids_by_slug(["dinner"])
@@ -0,0 +1,91 @@
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+import pytest
+from rest_framework.authtoken.models import Token
+
+from api.models import Recipe
+
+pytestmark = pytest.mark.django_db(
+    transaction=True, databases=["default", "replica_1"]
+)
+
+
+@pytest.fixture(autouse=True)
+def replica(settings):
+    settings.DATABASE_REPLICAS = ["replica_1"]
+
+
+@pytest.fixture
+def token_client(make_user, client_for):
+    user = make_user("reader")
+    client = client_for()
+    client.credentials(
+        HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=user).key}"
+    )
+    return client
+
+
+def recipe_queries(client, method, url):
+    """Запросы к рецептам в default и в реплике.
+
+    Токен всегда проверяется в default, поэтому считаются только запросы
+    к таблице рецептов.
+    """
+    with CaptureQueriesContext(connections["default"]) as primary:
+        with CaptureQueriesContext(connections["replica_1"]) as replica:
+            response = getattr(client, method)(url)
+
+    def count(context):
+        return sum(
+            '"api_recipe"' in query["sql"]
+            for query in context.captured_queries
+        )
+
+    return response, count(primary), count(replica)
+
+
+@pytest.fixture
+def recipe(make_user, make_recipe):
+    return make_recipe(make_user("author"))
+
+
+def test_safe_request_reads_from_replica(client_for, recipe):
+    response, primary, replica = recipe_queries(
+        client_for(), "get", "/api/recipes/"
+    )
+
+    assert response.status_code == 200
+    assert primary == 0
+    assert replica > 0
+
+
+def test_successful_write_pins_client_to_primary(token_client, recipe):
+    response, _, replica = recipe_queries(
+        token_client, "post", f"/api/recipes/{recipe.id}/favorite/"
+    )
+    assert response.status_code == 201
+    assert replica == 0
+
+    response, primary, replica = recipe_queries(
+        token_client, "get", "/api/recipes/"
+    )
+    assert response.status_code == 200
+    assert response.json()["results"][0]["is_favorited"] is True
+    assert primary > 0
+    assert replica == 0
+
+
+def test_failed_write_does_not_pin(token_client, recipe):
+    missing_id = Recipe.objects.latest("id").id + 1
+    response, _, _ = recipe_queries(
+        token_client, "post", f"/api/recipes/{missing_id}/favorite/"
+    )
+    assert response.status_code == 400
+
+    response, primary, replica = recipe_queries(
+        token_client, "get", "/api/recipes/"
+    )
+    assert response.status_code == 200
+    assert primary == 0
+    assert replica > 0
@@ -0,0 +1,29 @@
+import pytest
+
+from api.models import AmountIngredientInRecipe, Ingredient, Recipe
+from api.search import search_recipes
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+def found(query):
+    return list(search_recipes(Recipe.objects.all(), query))
+
+
+def test_amounts_saved_after_recipe_are_indexed(make_user):
+    recipe = Recipe.objects.create(
+        author=make_user("author"),
+        name="Суп",
+        text="Описание",
+        cooking_time=10,
+        image="recipes/images/test.jpg",
+    )
+    basil = Ingredient.objects.create(name="базилик", measurement_unit="г")
+    amount = AmountIngredientInRecipe.objects.create(
+        recipe=recipe, ingredients=basil, amount=5
+    )
+
+    assert found("базилик") == [recipe]
+
+    amount.delete()
+    assert found("базилик") == []
@@ -0,0 +1,20 @@
+import pytest
+
+pytestmark = pytest.mark.django_db
+
+
+def test_subscription_recipes_have_absolute_urls(
+    make_user, make_recipe, client_for
+):
+    user = make_user("user")
+    author = make_user("author")
+    make_recipe(author)
+    client = client_for(user)
+
+    subscribed = client.post(f"/api/users/{author.id}/subscribe/").json()
+    listed = client.get("/api/users/subscriptions/").json()["results"][0]
+
+    assert listed["recipes"] == subscribed["recipes"]
+    recipe = listed["recipes"][0]
+    assert recipe["image"].startswith("http://testserver/")
+    assert recipe["images"]["card"]["jpeg"].startswith("http://testserver/")
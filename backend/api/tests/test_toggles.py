@@ -0,0 +1,116 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+import pytest
+
+from api.business_logic import compute_cart_totals
+from api.models import (
+    Cart,
+    CartIngredientTotal,
+    Favorite,
+    Follow,
+    FootgramUser,
+    Recipe,
+    TimelineEntry
+)
+
+THREADS = 8
+# INSERT ... RETURNING, SELECT рецепта для ответа, счетчик.
+FAVORITE_QUERIES = 3
+# INSERT ... RETURNING, SELECT автора, счетчик, лента одним INSERT ...
+# SELECT и рецепты для ответа с учетом recipes_limit.
+SUBSCRIBE_QUERIES = 5
+
+
+def statements(context):
+    return [
+        query["sql"]
+        for query in context.captured_queries
+        if "SAVEPOINT" not in query["sql"]
+    ]
+
+
+def hammer(run_concurrently, client_for, user, method, url):
+    def request():
+        response = getattr(client_for(user), method)(url)
+        return response.status_code
+
+    return sorted(run_concurrently(request, [()] * THREADS))
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize(
+    "model, path, counter",
+    [
+        (Favorite, "favorite", "favorites_count"),
+        (Cart, "shopping_cart", "in_carts_count"),
+    ],
+)
+def test_recipe_toggle_under_contention(
+    make_user,
+    make_recipe,
+    client_for,
+    run_concurrently,
+    model,
+    path,
+    counter,
+):
+    user = make_user("user")
+    recipe = make_recipe(
+        make_user("author"), ingredients=[("соль", "г", 5), ("мука", "г", 50)]
+    )
+    url = f"/api/recipes/{recipe.id}/{path}/"
+
+    statuses = hammer(run_concurrently, client_for, user, "post", url)
+
+    assert statuses == [201] + [400] * (THREADS - 1)
+    assert model.objects.filter(user=user, recipe=recipe).count() == 1
+    assert getattr(Recipe.objects.get(pk=recipe.pk), counter) == 1
+    assert set(
+        CartIngredientTotal.objects.filter(user=user).values_list(
+            "user_id", "ingredient_id", "total_amount"
+        )
+    ) == set(compute_cart_totals([user.id]))
+
+    statuses = hammer(run_concurrently, client_for, user, "delete", url)
+
+    assert statuses == [204] + [400] * (THREADS - 1)
+    assert getattr(Recipe.objects.get(pk=recipe.pk), counter) == 0
+    assert not CartIngredientTotal.objects.filter(user=user).exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_subscribe_under_contention(make_user, client_for, run_concurrently):
+    user = make_user("user")
+    author = make_user("author")
+    url = f"/api/users/{author.id}/subscribe/"
+
+    statuses = hammer(run_concurrently, client_for, user, "post", url)
+
+    assert statuses == [201] + [400] * (THREADS - 1)
+    assert Follow.objects.filter(user=user, author=author).count() == 1
+    assert FootgramUser.objects.get(pk=author.pk).followers_count == 1
+
+
+@pytest.mark.django_db
+def test_toggle_queries(make_user, make_recipe, client_for):
+    user = make_user("user")
+    author = make_user("author")
+    recipes = [
+        make_recipe(author, name=f"Рецепт {index}") for index in range(5)
+    ]
+    client = client_for(user)
+
+    with CaptureQueriesContext(connection) as favorite:
+        response = client.post(f"/api/recipes/{recipes[0].id}/favorite/")
+    assert response.status_code == 201
+    with CaptureQueriesContext(connection) as subscribe:
+        response = client.post(
+            f"/api/users/{author.id}/subscribe/?recipes_limit=2"
+        )
+    assert response.status_code == 201
+    assert response.json()["is_subscribed"] is True
+    assert len(response.json()["recipes"]) == 2
+    assert len(statements(favorite)) == FAVORITE_QUERIES
+    assert len(statements(subscribe)) == SUBSCRIBE_QUERIES
+    assert TimelineEntry.objects.filter(user=user).count() == len(recipes)
@@ -0,0 +1,54 @@
+import base64
+
+from django.core.files.base import ContentFile
+
+import pytest
+from rest_framework.exceptions import ValidationError
+
+from api import images, uploads
+from api.models import Ingredient, Recipe, Tag
+
+
+def wait_for_uploads():
+    for future in list(uploads._pending.values()):
+        future.result()
+
+
+@pytest.mark.django_db
+def test_token_is_bound_to_uploader(make_user, media_root, make_jpeg):
+    owner = make_user("owner")
+    other = make_user("other")
+    token = uploads.stage(ContentFile(make_jpeg(), name="photo.jpg"), owner)
+
+    with pytest.raises(ValidationError):
+        uploads.resolve(token, other)
+    assert images.PROCESSED_NAME.match(uploads.resolve(token, owner))
+
+
+@pytest.mark.django_db(transaction=True)
+def test_inline_image_is_processed_after_commit(
+    make_user, client_for, media_root, make_jpeg
+):
+    author = make_user("author")
+    tag = Tag.objects.create(name="Обед", color="#49B64E", slug="lunch")
+    salt = Ingredient.objects.create(name="соль", measurement_unit="г")
+    encoded = base64.b64encode(make_jpeg()).decode()
+
+    response = client_for(author).post(
+        "/api/recipes/",
+        {
+            "name": "Суп",
+            "text": "Описание",
+            "cooking_time": 10,
+            "tags": [tag.id],
+            "ingredients": [{"id": salt.id, "amount": 5}],
+            "image": f"data:image/jpeg;base64,{encoded}",
+        },
+        format="json",
+    )
+
+    assert response.status_code == 201
+    wait_for_uploads()
+    recipe = Recipe.objects.get(pk=response.json()["id"])
+    assert images.PROCESSED_NAME.match(recipe.image.name)
+    assert not any((media_root / "uploads" / str(author.id)).iterdir())
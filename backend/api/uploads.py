@@ -0,0 +1,139 @@
+import re
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from PIL import Image, UnidentifiedImageError
+from rest_framework import serializers
+
+from api import const, images
+from api.models import Recipe
+
+TOKEN = re.compile(r"^[0-9a-f]{32}$")
+STAGED_NAME = re.compile(
+    rf"^{const.UPLOAD_DIR}/(?P<user_id>\d+)/(?P<token>[0-9a-f]{{32}})$"
+)
+
+_executor = ThreadPoolExecutor(
+    max_workers=const.IMAGE_PROCESSING_WORKERS,
+    thread_name_prefix="recipe-image",
+)
+_pending = {}
+
+
+def _staged_name(user_id, token):
+    return f"{const.UPLOAD_DIR}/{user_id}/{token}"
+
+
+def _result_key(user_id, token):
+    return f"upload:{user_id}:{token}"
+
+
+def check_image(file):
+    """Проверяет формат по заголовку файла, не декодируя изображение."""
+    try:
+        with Image.open(file) as image:
+            image_format = image.format
+    except (UnidentifiedImageError, OSError):
+        image_format = None
+    file.seek(0)
+    if image_format not in const.UPLOAD_IMAGE_FORMATS:
+        raise serializers.ValidationError(
+            "Загрузите изображение в формате JPEG, PNG, WebP или GIF"
+        )
+    return file
+
+
+def _process(user_id, token, recipe_id=None):
+    name = _staged_name(user_id, token)
+    with default_storage.open(name) as staged:
+        original_name = images.process_recipe_image(staged)
+    cache.set(
+        _result_key(user_id, token), original_name, const.UPLOAD_TOKEN_TTL
+    )
+    if recipe_id is not None:
+        close_old_connections()
+        try:
+            # Только если рецепт с тех пор не получил другую картинку.
+            Recipe.objects.filter(pk=recipe_id, image=name).update(
+                image=original_name, updated_at=timezone.now()
+            )
+        finally:
+            close_old_connections()
+    default_storage.delete(name)
+    return original_name
+
+
+def _submit(user_id, token, recipe_id=None):
+    key = (user_id, token)
+    _pending[key] = _executor.submit(_process, user_id, token, recipe_id)
+    _pending[key].add_done_callback(lambda _: _pending.pop(key, None))
+
+
+def _save(file, user):
+    token = uuid.uuid4().hex
+    default_storage.save(_staged_name(user.id, token), file)
+    return token
+
+
+def stage(file, user):
+    """Сохраняет загрузку во временный каталог и обрабатывает ее в фоне.
+
+    Django уже записал тело запроса на диск по частям
+    (TemporaryFileUploadHandler), здесь файл только переносится в
+    хранилище. Возвращает токен, по которому user может привязать
+    картинку к рецепту; другим пользователям токен не подходит.
+    """
+    token = _save(file, user)
+    _submit(user.id, token)
+    return token
+
+
+def stage_for_recipe(file, user):
+    """Картинка, переданная в самом запросе создания или изменения рецепта.
+
+    Возвращает имя загруженного файла: рецепт сохраняется со ссылкой на
+    него (variant_urls отдает его для всех вариантов), а process_on_commit
+    после фиксации транзакции обрабатывает картинку в фоне и подменяет ее
+    в рецепте.
+    """
+    return _staged_name(user.id, _save(file, user))
+
+
+def process_on_commit(recipe):
+    """Запускает обработку картинки из stage_for_recipe после фиксации."""
+    match = STAGED_NAME.match(recipe.image.name)
+    if match is None:
+        return
+    transaction.on_commit(
+        lambda: _submit(int(match["user_id"]), match["token"], recipe.pk)
+    )
+
+
+def resolve(token, user):
+    """Имя обработанной картинки по токену загрузки пользователя user.
+
+    Если загрузка еще обрабатывается в этом процессе, дожидается ее; если
+    ее принял другой воркер и не успел обработать, обрабатывает сама —
+    результат от этого не меняется. Токены ищутся среди загрузок самого
+    пользователя, поэтому чужой токен не найдется.
+    """
+    if not isinstance(token, str) or not TOKEN.match(token):
+        raise serializers.ValidationError(
+            {"image_token": "Некорректный токен"}
+        )
+    future = _pending.get((user.id, token))
+    if future is not None:
+        return future.result()
+    original_name = cache.get(_result_key(user.id, token))
+    if original_name is not None:
+        return original_name
+    if not default_storage.exists(_staged_name(user.id, token)):
+        raise serializers.ValidationError(
+            {"image_token": "Загрузка не найдена"}
+        )
+    return _process(user.id, token)
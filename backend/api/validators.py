@@ -1,5 +1,3 @@
-from django.core.exceptions import ObjectDoesNotExist
-
 from rest_framework import serializers
 
 
@@ -22,33 +20,49 @@ class RecipeValidator:
         if not objs:
             raise serializers.ValidationError({name: f"{name} не переданы"})
 
-    def _obj_does_not_exist(self, model, obj_item, name):
+    def _resolve(self, model, obj_ids, name):
+        """Находит все объекты одним запросом, сохраняя порядок obj_ids."""
         try:
-            return model.objects.get(id=obj_item)
-        except ObjectDoesNotExist:
+            obj_ids = [int(obj_id) for obj_id in obj_ids]
+        except (TypeError, ValueError):
+            raise serializers.ValidationError({name: f"{name} не найден"})
+        objs = model.objects.in_bulk(obj_ids)
+        if len(objs) != len(set(obj_ids)):
             raise serializers.ValidationError({name: f"{name} не найден"})
+        return obj_ids, objs
 
     def tag_validation(self, model, objs):
         self._obj_is_empty(objs, "tag")
-        obj_list = []
-        for obj_item in objs:
-            obj = self._obj_does_not_exist(model, obj_item, "tag")
-            if obj in obj_list:
-                raise serializers.ValidationError({"tags": "Тэги одинаковы"})
-            obj_list.append(obj)
+        obj_ids, tags = self._resolve(model, objs, "tag")
+        if len(set(obj_ids)) != len(obj_ids):
+            raise serializers.ValidationError({"tags": "Тэги одинаковы"})
+        return [tags[obj_id] for obj_id in obj_ids]
 
     def ingredient_validation(self, model, objs):
         self._obj_is_empty(objs, "ingredient")
-        obj_list = []
-        for obj_item in objs:
-            obj_item_id = obj_item.get("id")
-            obj = self._obj_does_not_exist(model, obj_item_id, "ingredient")
-            if obj in obj_list:
-                raise serializers.ValidationError(
-                    {"ingredient": "Ингридиенты одинаковы"}
-                )
-            obj_list.append(obj)
-            if int(obj_item["amount"]) <= 0:
+        if not isinstance(objs, list) or not all(
+            isinstance(obj_item, dict) for obj_item in objs
+        ):
+            raise serializers.ValidationError(
+                {"ingredients": "Ожидался список объектов {id, amount}"}
+            )
+        obj_ids, ingredients = self._resolve(
+            model, [obj_item.get("id") for obj_item in objs], "ingredient"
+        )
+        if len(set(obj_ids)) != len(obj_ids):
+            raise serializers.ValidationError(
+                {"ingredient": "Ингридиенты одинаковы"}
+            )
+        result = []
+        for obj_id, obj_item in zip(obj_ids, objs):
+            obj = ingredients[obj_id]
+            try:
+                amount = int(obj_item["amount"])
+            except (KeyError, TypeError, ValueError):
+                amount = 0
+            if amount <= 0:
                 raise serializers.ValidationError(
                     {"ingredients": f"Слишком мало {obj.name}"}
                 )
+            result.append((obj, amount))
+        return result
@@ -1,24 +1,50 @@
 from django.contrib.auth import get_user_model
-from django.core.exceptions import ObjectDoesNotExist
-from django.http.response import HttpResponse
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import Http404
+from django.http.response import StreamingHttpResponse
 
 from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.generics import get_object_or_404
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.serializers import ValidationError
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
-from django.db.models import Exists, OuterRef
 
-from api import business_logic, models, pagination, permission, serializers
+from api import (
+    business_logic,
+    conditional,
+    const,
+    models,
+    pagination,
+    permission,
+    reference_cache,
+    search,
+    serializers,
+    uploads,
+    viewer_state
+)
 from api.filters import AuthorAndTagFilter
-from api import const
 
 User = get_user_model()
 
 
+def get_recipes_limit(request):
+    limit = request.query_params.get("recipes_limit")
+    return int(limit) if limit and limit.isdigit() else None
+
+
+def parse_id(value):
+    """id из URL; для нечислового значения — 404, как у get_object_or_404."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise Http404
+
+
 class FootGramUserViewSet(DjoserUserViewSet):
     pagination_class = pagination.LimitPage
 
@@ -31,101 +57,290 @@ class FootGramUserViewSet(DjoserUserViewSet):
         return super().me(request, *args, **kwargs)
 
     @action(["post"], detail=True, permission_classes=[IsAuthenticated])
+    @transaction.atomic
     def subscribe(self, request, id=None):
         user = request.user
-        author = get_object_or_404(User, id=id)
-        serializer = serializers.AuthorUserSerializer(
-            data={"user": user.id, "author": author.id}
+        author_id = parse_id(id)
+        if author_id == user.id:
+            raise ValidationError(
+                {"error": "Вы не можете подписываться на самого себя"}
+            )
+        added = business_logic.insert_relation(
+            models.Follow, user.id, "author", author_id
+        )
+        author = get_object_or_404(User, id=author_id)
+        if not added:
+            raise ValidationError(
+                {"error": "Вы уже подписаны на этого пользователя"}
+            )
+        follow = models.Follow(user=user, author=author)
+        business_logic.change_counters(models.Follow, [follow], 1)
+        viewer_state.changed_on_commit([user.id])
+        business_logic.backfill_timeline(user.id, [author_id])
+        business_logic.attach_limited_recipes(
+            [author], get_recipes_limit(request)
+        )
+        serializer = serializers.FollowSerializer(
+            follow, context={"request": request}
         )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-    @action(detail=False, permission_classes=[IsAuthenticated])
+    @action(
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        pagination_class=pagination.SubscriptionPage,
+    )
     def subscriptions(self, request):
         user = request.user
-        queryset = models.Follow.objects.filter(user=user)
-        pages = self.paginate_queryset(queryset)
-        serializer = serializers.FollowSerializer(
-            pages,
-            many=True,
-            context={"limit": request.GET.get("recipes_limit")},
+        queryset = User.objects.filter(following__user=user).order_by(
+            "-following__id"
+        )
+        pages = business_logic.attach_limited_recipes(
+            self.paginate_queryset(queryset), get_recipes_limit(request)
+        )
+        serializer = serializers.SubscriptionSerializer(
+            pages, many=True, context={"request": request}
         )
         return self.get_paginated_response(serializer.data)
 
     @subscribe.mapping.delete
+    @transaction.atomic
     def del_subscribe(self, request, id=None):
         user = request.user
-        author = get_object_or_404(User, id=id)
-        if user == author:
+        author_id = parse_id(id)
+        if author_id == user.id:
             return Response(
                 {"errors": "Вы не можете отписываться от самого себя"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        follow = models.Follow.objects.filter(user=user, author=author)
-        if follow.exists():
-            follow.delete()
+        if business_logic.delete_relation(
+            models.Follow, user.id, "author", author_id
+        ):
+            follow = models.Follow(user=user, author_id=author_id)
+            business_logic.change_counters(models.Follow, [follow], -1)
+            viewer_state.changed_on_commit([user.id])
+            business_logic.remove_from_timeline(user, author_id)
             return Response(status=status.HTTP_204_NO_CONTENT)
-
+        get_object_or_404(User, id=author_id)
         return Response(
             {"errors": "Вы уже отписались"}, status=status.HTTP_400_BAD_REQUEST
         )
 
 
-class TagViewSet(ReadOnlyModelViewSet):
+class CachedReferenceViewSet(ReadOnlyModelViewSet):
+    """Справочник, который читается из reference_cache, а не из БД."""
+
+    reference_cache = None
+
+    def get_object(self):
+        objs = self.reference_cache.derived("by_id", reference_cache.by_id)
+        try:
+            obj = objs[int(self.kwargs[self.lookup_field])]
+        except (KeyError, ValueError):
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+
+class TagViewSet(CachedReferenceViewSet):
     queryset = models.Tag.objects.all()
     serializer_class = serializers.TagSerializer
     permission_classes = (permission.AdminChangeOrReadOnly,)
+    reference_cache = reference_cache.tag_cache
 
+    def list(self, request, *args, **kwargs):
+        return Response(list(serializers.get_serialized_tags().values()))
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+
+class IngredientViewSet(CachedReferenceViewSet):
     queryset = models.Ingredient.objects.all()
     serializer_class = serializers.IngredientSerializer
     permission_classes = (permission.AdminChangeOrReadOnly,)
+    reference_cache = reference_cache.ingredient_cache
+
+    def list(self, request, *args, **kwargs):
+        ingredients = search.search_ingredients(
+            request.query_params.get("name", "")
+        )
+        serializer = self.get_serializer(ingredients, many=True)
+        return Response(serializer.data)
 
 
 class RecipeViewSet(ModelViewSet):
     serializer_class = serializers.RecipeSerializer
-    pagination_class = pagination.LimitPage
+    pagination_class = pagination.RecipePage
     filter_class = AuthorAndTagFilter
     permission_classes = [permission.ForOwnerOrReadOnly]
+    statement_timeout = "default"
 
     def get_queryset(self):
-        queryset = models.Recipe.objects.select_related(
-            "author"
+        amounts = models.AmountIngredientInRecipe.objects.select_related(
+            "ingredients"
+        )
+        return models.Recipe.objects.order_by(
+            "-pub_date", "-id"
         ).prefetch_related(
-            "tags", "ingredients"
+            Prefetch("tags", queryset=models.Tag.objects.only("id")),
+            "author",
+            Prefetch("ingredient", queryset=amounts),
         )
-        if self.request.user.is_anonymous:
-            return queryset
-        user = self.request.user
-        queryset = queryset.annotate(
-            is_in_shopping_cart=Exists(user.in_cart.filter(id=OuterRef('pk'))),
-            is_favorited=Exists(user.favorites.filter(id=OuterRef('pk'))),
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(
+            conditional.recipe_versions(queryset)
+        )
+        etag = conditional.make_etag(
+            request, page, *self.paginator.get_page_state()
+        )
+        response = conditional.not_modified(request, etag)
+        if response is not None:
+            return response
+        recipes = queryset.in_bulk([row[0] for row in page])
+        serializer = self.get_serializer(
+            [recipes[row[0]] for row in page], many=True
+        )
+        response = self.get_paginated_response(serializer.data)
+        return conditional.set_validators(response, etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            rows = list(
+                conditional.recipe_versions(
+                    self.get_queryset().filter(pk=kwargs["pk"])
+                )
+            )
+        except (TypeError, ValueError):
+            raise Http404
+        if not rows:
+            raise Http404
+        etag = conditional.make_etag(request, rows)
+        response = conditional.not_modified(request, etag)
+        if response is not None:
+            return response
+        response = super().retrieve(request, *args, **kwargs)
+        return conditional.set_validators(response, etag)
+
+    def _reload_for_response(self, serializer):
+        serializer.instance = self.get_queryset().get(
+            pk=serializer.instance.pk
         )
-        return queryset
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        with transaction.atomic():
+            serializer.save(author=self.request.user)
+            business_logic.fan_out_recipe(serializer.instance)
+        self._reload_for_response(serializer)
+
+    def perform_update(self, serializer):
+        serializer.save()
+        self._reload_for_response(serializer)
 
+    @transaction.atomic
     def _delete_instance(self, request, model, pk):
-        recipe = get_object_or_404(models.Recipe, id=pk)
-        try:
-            obj = model.objects.get(user=request.user, recipe=recipe)
-        except ObjectDoesNotExist:
+        pk = parse_id(pk)
+        if not business_logic.delete_relation(
+            model, request.user.id, "recipe", pk
+        ):
+            if not models.Recipe.objects.filter(id=pk).exists():
+                raise Http404
             raise ValidationError({"errors": "Рецепт не найден"})
-        obj.delete()
+        business_logic.recipes_list_changed(model, request.user, [pk], -1)
 
+    @transaction.atomic
     def _create_favorite_or_shop_cart(
         self, request, serializer_class, pk, model
     ):
-        serializer = serializer_class(
-            data={},
-            context={"user": request.user, "recipe": pk, "model": model},
+        try:
+            pk = parse_id(pk)
+        except Http404:
+            raise ValidationError({"recipe": "Рецепт не найден"})
+        added = business_logic.insert_relation(
+            model, request.user.id, "recipe", pk
+        )
+        # Один SELECT и для ответа, и чтобы отличить 400 от "нет рецепта".
+        recipe = (
+            models.Recipe.objects.filter(id=pk)
+            .only("id", "name", "image", "cooking_time")
+            .first()
         )
+        if recipe is None:
+            raise ValidationError({"recipe": "Рецепт не найден"})
+        if not added:
+            raise ValidationError({"errors": "Рецепт уже добавлен в список"})
+        business_logic.recipes_list_changed(model, request.user, [pk], 1)
+        return serializer_class(model(user=request.user, recipe=recipe))
+
+    def _bulk_change_list(self, request, model):
+        serializer = serializers.BulkRecipesSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return serializer
+        recipe_ids = serializer.validated_data["recipes"]
+        if request.method == "DELETE":
+            statuses = business_logic.bulk_remove_recipes(
+                model, request.user, recipe_ids
+            )
+        else:
+            statuses = business_logic.bulk_add_recipes(
+                model, request.user, recipe_ids
+            )
+        return Response(
+            [
+                {"id": recipe_id, "status": recipe_status}
+                for recipe_id, recipe_status in statuses.items()
+            ]
+        )
+
+    @action(
+        detail=False,
+        methods=["post", "delete"],
+        url_path="favorite",
+        url_name="bulk-favorite",
+        permission_classes=[IsAuthenticated],
+    )
+    def bulk_favorite(self, request):
+        return self._bulk_change_list(request, models.Favorite)
+
+    @action(
+        detail=False,
+        methods=["post", "delete"],
+        url_path="shopping_cart",
+        url_name="bulk-shopping-cart",
+        permission_classes=[IsAuthenticated],
+    )
+    def bulk_shopping_cart(self, request):
+        return self._bulk_change_list(request, models.Cart)
+
+    @action(
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        pagination_class=pagination.FeedPage,
+    )
+    def feed(self, request):
+        rows = self.paginate_queryset(
+            business_logic.get_feed_sources(request.user)
+        )
+        recipes = self.get_queryset().in_bulk([row[0] for row in rows])
+        serializer = self.get_serializer(
+            [recipes[row[0]] for row in rows if row[0] in recipes], many=True
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="images",
+        permission_classes=[IsAuthenticated],
+        parser_classes=[MultiPartParser],
+    )
+    def upload_image(self, request):
+        serializer = serializers.ImageUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        token = uploads.stage(
+            serializer.validated_data["image"], request.user
+        )
+        return Response(
+            {"image_token": token}, status=status.HTTP_201_CREATED
+        )
 
     @action(
         detail=True,
@@ -166,16 +381,32 @@ class RecipeViewSet(ModelViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
-        detail=False, methods=["get"], permission_classes=[IsAuthenticated]
+        detail=False,
+        methods=["get"],
+        permission_classes=[IsAuthenticated],
+        statement_timeout="export",
     )
     def download_shopping_cart(self, request):
         user = self.request.user
         if not user.in_cart.exists():
             return Response(status=status.HTTP_400_BAD_REQUEST)
-        filename = const.FILE_NAME.format(username=user.username)
-        shopping_list = business_logic.get_list_for_shop(user)
-        response = HttpResponse(
-            shopping_list, content_type="text.txt; charset=utf-8"
+        extension = request.query_params.get(
+            "file_format", const.DEFAULT_SHOPPING_LIST_FORMAT
+        )
+        if extension not in business_logic.SHOPPING_LIST_FORMATS:
+            return Response(
+                {"errors": "Неподдерживаемый формат файла"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        render, content_type = business_logic.SHOPPING_LIST_FORMATS[
+            extension
+        ]
+        filename = const.FILE_NAME.format(
+            username=user.username, extension=extension
+        )
+        rows = business_logic.get_list_for_shop(user).iterator()
+        response = StreamingHttpResponse(
+            render(rows), content_type=content_type
         )
         response["Content-Disposition"] = f"attachment; filename={filename}"
         return response
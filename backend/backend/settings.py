@@ -1,8 +1,11 @@
 import os
+import tempfile
 from pathlib import Path
 
 from dotenv import load_dotenv
 
+from backend.database import database_from_env, replicas_from_env
+
 load_dotenv()
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -35,6 +38,12 @@ STATIC_ROOT = os.path.join(BASE_DIR, "backend_static")
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+FILE_UPLOAD_HANDLERS = [
+    "django.core.files.uploadhandler.TemporaryFileUploadHandler",
+]
+
+SHOPPING_LIST_FONT = os.getenv("SHOPPING_LIST_FONT", "DejaVuSans.ttf")
+
 
 INSTALLED_APPS = [
     "django.contrib.admin",
@@ -53,12 +62,15 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "api.middleware.ConnectionHealthCheckMiddleware",
+    "api.middleware.ReplicaRoutingMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "api.middleware.StatementTimeoutMiddleware",
 ]
 
 ROOT_URLCONF = "backend.urls"
@@ -85,21 +97,36 @@ WSGI_APPLICATION = "backend.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-# DATABASES = {
-#     "default": {
-#         "ENGINE": "django.db.backends.postgresql",
-#         "NAME": os.getenv("POSTGRES_DB", "django"),
-#         "USER": os.getenv("POSTGRES_USER", "django"),
-#         "PASSWORD": os.getenv("POSTGRES_PASSWORD", ""),
-#         "HOST": os.getenv("DB_HOST", ""),
-#         "PORT": os.getenv("DB_PORT", 5432),
-#     }
-# }
-
 DATABASES = {
+    "default": database_from_env(BASE_DIR / "db.sqlite3"),
+    **replicas_from_env(),
+}
+
+# Безопасные запросы читают из случайной реплики, если клиент не писал в
+# базу последние DB_REPLICA_PIN_SECONDS секунд, см.
+# api.middleware.ReplicaRoutingMiddleware.
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+DATABASE_ROUTERS = ["api.db_routers.ReplicaRouter"]
+DB_REPLICA_PIN_SECONDS = int(os.getenv("DB_REPLICA_PIN_SECONDS", 10))
+
+# statement_timeout (мс) по классам эндпоинтов, см.
+# api.middleware.StatementTimeoutMiddleware. Класс задается атрибутом
+# statement_timeout у view или @action; остальные получают "default".
+DB_STATEMENT_TIMEOUTS = {
+    "default": int(os.getenv("DB_STATEMENT_TIMEOUT", 5000)),
+    "export": int(os.getenv("DB_EXPORT_STATEMENT_TIMEOUT", 30000)),
+}
+
+CACHES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND",
+            "django.core.cache.backends.filebased.FileBasedCache",
+        ),
+        "LOCATION": os.getenv(
+            "CACHE_LOCATION",
+            os.path.join(tempfile.gettempdir(), "foodgram_cache"),
+        ),
     }
 }
 
@@ -127,7 +154,7 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework.authentication.TokenAuthentication",
+        "api.authentication.CachedTokenAuthentication",
     ),
     "DEFAULT_FILTER_BACKENDS": [
         "django_filters.rest_framework.DjangoFilterBackend"
@@ -137,6 +164,12 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Дополнительно хранить кэш токенов api.authentication в общем кэше,
+# чтобы новый воркер не ходил в базу за уже известными токенами.
+TOKEN_AUTH_SHARED_CACHE = (
+    os.getenv("TOKEN_AUTH_SHARED_CACHE", "False") == "True"
+)
+
 DJOSER = {
     "LOGIN_FIELD": "email",
     "HIDE_USERS": False,
@@ -0,0 +1,15 @@
+"""Настройки для pytest.
+
+Основные настройки читаются из окружения, поэтому тестовые значения
+задаются до их импорта.
+"""
+import os
+
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ.setdefault(
+    "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+)
+# Вторая база SQLite для тестов маршрутизации чтения в реплику.
+os.environ.setdefault("DATABASE_REPLICA_URLS", "sqlite://")
+
+from backend.settings import *  # noqa: E402,F401,F403
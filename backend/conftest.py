@@ -0,0 +1,141 @@
+import io
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def django_db_modify_db_settings(django_db_modify_db_settings_parallel_suffix):
+    """Тестовая база в файле, а не в памяти.
+
+    SQLite в памяти с общим кэшем отвечает "database table is locked" на
+    параллельную запись, а тесты гонок пишут из нескольких потоков.
+    """
+    from django.db import connections
+
+    test_settings = connections["default"].settings_dict["TEST"]
+    if not test_settings.get("NAME"):
+        test_settings["NAME"] = os.path.join(
+            tempfile.gettempdir(), "foodgram_test.sqlite3"
+        )
+
+
+@pytest.fixture(autouse=True)
+def clean_caches(settings):
+    """Кэши процесса и общий кэш не переживают тест.
+
+    Реплика по умолчанию выключена: иначе чтения тестов с одной базой
+    уходили бы в replica_1. Тесты маршрутизации включают ее сами.
+    """
+    from django.core.cache import cache
+
+    from api.authentication import token_cache
+    from api.reference_cache import ingredient_cache, tag_cache
+
+    settings.DATABASE_REPLICAS = []
+    cache.clear()
+    for process_cache in (tag_cache, ingredient_cache, token_cache):
+        process_cache.invalidate()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def make_user(db):
+    from api.models import FootgramUser
+
+    def make(username):
+        return FootgramUser.objects.create_user(
+            email=f"{username}@example.com",
+            username=username,
+            first_name=username,
+            last_name=username,
+            password="Passw0rd!123",
+        )
+
+    return make
+
+
+@pytest.fixture
+def make_recipe(db):
+    from api.models import AmountIngredientInRecipe, Ingredient, Recipe, Tag
+
+    def make(author, name="Рецепт", ingredients=(("соль", "г", 5),)):
+        recipe = Recipe.objects.create(
+            author=author,
+            name=name,
+            text="Описание",
+            cooking_time=10,
+            image="recipes/images/test.jpg",
+        )
+        for ingredient_name, unit, amount in ingredients:
+            ingredient, _ = Ingredient.objects.get_or_create(
+                name=ingredient_name, measurement_unit=unit
+            )
+            AmountIngredientInRecipe.objects.create(
+                recipe=recipe, ingredients=ingredient, amount=amount
+            )
+        tag, _ = Tag.objects.get_or_create(
+            slug="breakfast", defaults={"name": "Завтрак", "color": "#E26C2D"}
+        )
+        recipe.tags.add(tag)
+        return recipe
+
+    return make
+
+
+@pytest.fixture
+def client_for():
+    from rest_framework.test import APIClient
+
+    def make(user=None):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        return client
+
+    return make
+
+
+@pytest.fixture
+def run_concurrently():
+    """Вызывает func со всеми наборами аргументов одновременно, каждый в
+    своем потоке и со своим соединением с базой.
+    """
+    from django.db import connections
+
+    def run(func, args_list):
+        barrier = threading.Barrier(len(args_list))
+
+        def call(args):
+            barrier.wait()
+            try:
+                return func(*args)
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(len(args_list)) as executor:
+            return list(executor.map(call, args_list))
+
+    return run
+
+
+@pytest.fixture
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def make_jpeg():
+    from PIL import Image
+
+    def make(size=(800, 600)):
+        buffer = io.BytesIO()
+        Image.new("RGB", size, "red").save(buffer, "JPEG")
+        return buffer.getvalue()
+
+    return make